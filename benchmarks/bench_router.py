@@ -0,0 +1,162 @@
+"""End-to-end latency benchmark for the StreamBox plugin.
+
+Drives Router.dispatch for each action against the local mock API
+(mock_api.py) with Kodi replaced by kodi_shims.py, and reports per action:
+
+    p50/p95   wall time until the listing was handed to Kodi (endOfDirectory)
+              or playback was started, else until dispatch() returned
+    req/run   API requests per invocation, including background work
+              (revalidation, prefetch) that finishes after dispatch()
+    KB/run    response bytes per invocation
+    errors    invocations where dispatch() raised (see --error-rate)
+
+Every run re-imports the plugin's modules, like Kodi's fresh interpreter
+per invocation, while the profile directory (tokens, response cache,
+library DB) persists across runs, so the first run of an action is cold
+and the rest show the cached path.
+
+    python benchmarks/bench_router.py --runs 20 --latency 0.15
+    python benchmarks/bench_router.py --actions movies,search_results --no-cache
+
+Not shipped with the addons; requires kodistubs (uv sync / pip install kodistubs).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PLUGIN_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'plugin.video.streambox')
+BASE_URL = 'plugin://plugin.video.streambox/'
+
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, PLUGIN_DIR)
+
+from kodi_shims import install  # noqa: E402
+from mock_api import MockStreamBox  # noqa: E402
+
+# (name, plugin query string); run in this order
+SCENARIOS = (
+    ('hub', '?action=hub'),
+    ('movies_menu', '?action=movies_menu'),
+    ('movies', '?action=movies&page=1'),
+    ('movies_page_2', '?action=movies&page=2'),
+    ('search', '?action=search'),
+    ('search_results', '?action=search_results&query=kolja&page=1'),
+    ('movie_detail', '?action=movie_detail&movie_id=7'),
+    ('toggle_favorite', '?action=toggle_favorite&movie_id=7'),
+    ('favorites', '?action=favorites'),
+    ('history', '?action=history'),
+)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values) + 0.5) - 1))
+    return values[index]
+
+
+def _purge_plugin_modules():
+    for name in [n for n in sys.modules if n == 'resources' or n.startswith('resources.')]:
+        del sys.modules[name]
+
+
+def invoke(kodi, query):
+    """Run one plugin invocation.
+
+    Returns (user-visible wall time in seconds, True if dispatch() raised).
+    """
+    _purge_plugin_modules()
+    kodi.reset()
+    start = time.perf_counter()
+    from resources.lib.router import Router
+
+    router = Router([BASE_URL, '1', query])
+    try:
+        router.dispatch()
+        failed = False
+    except Exception:
+        # Kodi would show the script error; count it and carry on
+        failed = True
+    end = time.perf_counter()
+    # Kodi joins the worker threads before the interpreter goes away
+    client = router._api_client
+    if client is not None and client._executor is not None:
+        client._executor.shutdown(wait=True)
+    return (kodi.directory_done or end) - start, failed
+
+
+def run(args):
+    profile = tempfile.mkdtemp(prefix='streambox-bench-')
+    settings = {
+        'auth.email': 'bench@example.com',
+        'auth.password': 'bench',
+        'cache.enabled': 'false' if args.no_cache else 'true',
+        'cache.prefetch': 'true' if args.prefetch else 'false',
+    }
+    kodi = install(profile, settings)
+    kodi.keyboard_text = 'kolja'
+
+    wanted = set(args.actions.split(',')) if args.actions else None
+    scenarios = [s for s in SCENARIOS if wanted is None or s[0] in wanted]
+    results = []
+    with MockStreamBox(latency=args.latency, jitter=args.jitter,
+                       error_rate=args.error_rate) as api:
+        kodi.settings['api.base_url'] = api.url
+        _purge_plugin_modules()
+        from resources.lib.auth import login
+        ok, msg = login()
+        if not ok:
+            raise SystemExit(f'Login against the mock API failed: {msg}')
+
+        for name, query in scenarios:
+            times, requests, size, errors = [], 0, 0, 0
+            for _ in range(args.runs):
+                api.reset()
+                elapsed, failed = invoke(kodi, query)
+                times.append(elapsed)
+                errors += failed
+                stats = api.stats()
+                requests += stats['requests']
+                size += stats['bytes']
+            results.append({
+                'action': name,
+                'runs': args.runs,
+                'p50_ms': round(percentile(times, 50) * 1000, 1),
+                'p95_ms': round(percentile(times, 95) * 1000, 1),
+                'first_ms': round(times[0] * 1000, 1),
+                'requests_per_run': round(requests / args.runs, 2),
+                'kb_per_run': round(size / args.runs / 1024, 2),
+                'errors': errors,
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Router.dispatch per action.')
+    parser.add_argument('--runs', type=int, default=20, help='invocations per action')
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='mock API latency per request in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--actions', help='comma-separated scenario names')
+    parser.add_argument('--no-cache', action='store_true', help='disable the response cache')
+    parser.add_argument('--prefetch', action='store_true', help='enable next-page prefetch')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = run(args)
+    print(f'{"action":<18}{"p50 ms":>9}{"p95 ms":>9}{"1st ms":>9}{"req/run":>9}{"KB/run":>9}{"errors":>8}')
+    for r in results:
+        print(f'{r["action"]:<18}{r["p50_ms"]:>9}{r["p95_ms"]:>9}{r["first_ms"]:>9}'
+              f'{r["requests_per_run"]:>9}{r["kb_per_run"]:>9}{r["errors"]:>8}')
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
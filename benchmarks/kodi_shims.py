@@ -0,0 +1,136 @@
+"""Working stand-ins for the Kodi APIs the StreamBox plugin calls.
+
+kodistubs provides importable xbmc* modules whose functions do nothing;
+install() patches the ones the plugin relies on so it can run outside Kodi:
+settings come from a dict, the profile lives in a local directory, vfs calls
+go to the filesystem, and directory items, notifications and playback are
+recorded in KODI instead of being shown.
+"""
+import os
+import time
+
+try:
+    import xbmc
+    import xbmcaddon
+    import xbmcgui
+    import xbmcplugin
+    import xbmcvfs
+except ImportError as e:
+    raise SystemExit('kodistubs is required: pip install kodistubs') from e
+
+
+class KodiState:
+    """What the plugin handed back to "Kodi" during one invocation."""
+
+    def __init__(self):
+        self.settings = {}
+        self.keyboard_text = ''
+        self.select_index = 0
+        self.log_level = xbmc.LOGWARNING
+        self.reset()
+
+    def reset(self):
+        self.items = []
+        self.directory_done = None
+        self.succeeded = None
+        self.played = None
+        self.notifications = []
+        self.builtins = []
+
+
+KODI = KodiState()
+
+
+class _File:
+    """xbmcvfs.File on top of the local filesystem."""
+
+    def __init__(self, path, mode='r'):
+        self._file = open(path, 'w' if mode == 'w' else 'r', encoding='utf-8')
+
+    def read(self):
+        return self._file.read()
+
+    def write(self, data):
+        self._file.write(data)
+        return True
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _Keyboard:
+
+    def __init__(self, default='', heading='', hidden=False):
+        self._text = KODI.keyboard_text or default
+
+    def doModal(self, autoclose=0):
+        pass
+
+    def isConfirmed(self):
+        return bool(self._text)
+
+    def getText(self):
+        return self._text
+
+
+class _Player:
+
+    def play(self, item='', listitem=None, windowed=False, startpos=-1):
+        KODI.played = item
+
+
+class _Dialog:
+
+    def select(self, heading, items, *args, **kwargs):
+        return KODI.select_index if items else -1
+
+    def notification(self, heading, message, icon='', time=5000, sound=True):
+        KODI.notifications.append(message)
+
+
+def _log(msg, level=xbmc.LOGDEBUG):
+    if level >= KODI.log_level:
+        print(msg)
+
+
+def _add_directory_items(handle, items, totalItems=0):
+    KODI.items.extend(items)
+    return True
+
+
+def _end_of_directory(handle, succeeded=True, updateListing=False, cacheToDisc=True):
+    KODI.directory_done = time.perf_counter()
+    KODI.succeeded = succeeded
+
+
+def install(profile_dir, settings=None):
+    """Patch the kodistubs modules; settings is a dict of addon setting values."""
+    os.makedirs(profile_dir, exist_ok=True)
+    KODI.settings = dict(settings or {})
+
+    xbmc.log = _log
+    xbmc.executebuiltin = lambda function, wait=False: KODI.builtins.append(function)
+    xbmc.Keyboard = _Keyboard
+    xbmc.Player = _Player
+
+    xbmcaddon.Addon.__init__ = lambda self, id=None: None
+    xbmcaddon.Addon.getSetting = lambda self, id: KODI.settings.get(id, '')
+    xbmcaddon.Addon.getAddonInfo = lambda self, id: profile_dir if id == 'profile' else ''
+
+    xbmcgui.Dialog = _Dialog
+
+    xbmcplugin.addDirectoryItems = _add_directory_items
+    xbmcplugin.endOfDirectory = _end_of_directory
+
+    xbmcvfs.translatePath = lambda path: path
+    xbmcvfs.exists = os.path.exists
+    xbmcvfs.mkdirs = lambda path: os.makedirs(path, exist_ok=True) or True
+    xbmcvfs.delete = lambda path: os.remove(path) or True
+    xbmcvfs.File = _File
+    return KODI
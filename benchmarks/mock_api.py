@@ -0,0 +1,277 @@
+"""Local stand-in for the StreamBox REST API.
+
+Implements the endpoints the plugin uses, over a generated catalog:
+
+    POST /auth/login             {email, password} -> {accessToken, refreshToken}
+    POST /auth/refresh           Bearer <refreshToken> -> {accessToken, refreshToken}
+    POST /movie/search           ?page&size[&query] -> paginated items (with ETag)
+    POST /movie/category/{name}  ?page&size -> paginated items (with ETag)
+    GET  /movie/{id}             -> {id, title}
+    POST /movie/{id}/stream      -> [{id, video: {...}, audio: {...}}, ...]
+    GET  /stream/{id}/play       -> {link}
+    GET  /user/me                -> {id, firstName, lastName, email}
+
+Tokens are unsigned JWTs with an exp claim. Like the real service, every
+endpoint reads its token from the Authorization header (the refresh token
+for /auth/refresh), so the plugin's expiry-driven refresh really refreshes.
+
+latency (seconds, plus optional jitter) is added to every request and
+error_rate is the share of requests answered with 503, to exercise retries
+and error paths.
+
+Run standalone with: python benchmarks/mock_api.py --port 8765 --latency 0.2
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+TOKEN_LIFETIME = 3600
+QUALITIES = ('2160p', '1080p', '720p', '480p')
+VIDEO_CODECS = ('HEVC', 'H264')
+AUDIO = (('AAC', 2), ('AC3', 6), ('EAC3', 6), ('DTS', 6))
+LANGUAGES = ('cs', 'sk', 'en')
+TITLE_WORDS = ('Pelisky', 'Samotari', 'Kolja', 'Vratne lahve', 'Obecna skola',
+               'Tmavomodry svet', 'Musime si pomahat', 'Babicka', 'Jachyme',
+               'Slunce seno', 'Limonadovy Joe', 'Kulovy blesk')
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip('=')
+
+
+def make_token(lifetime=TOKEN_LIFETIME):
+    """Return an unsigned JWT that expires in lifetime seconds."""
+    payload = {'sub': 'bench', 'exp': int(time.time()) + lifetime,
+               'jti': random.getrandbits(32)}
+    return f'{_b64({"alg": "none"})}.{_b64(payload)}.'
+
+
+def token_expiry(token):
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload))['exp']
+    except (IndexError, KeyError, ValueError):
+        return 0
+
+
+def build_catalog(size, seed=1):
+    """Return {id: movie} with deterministic titles and streams."""
+    rnd = random.Random(seed)
+    catalog = {}
+    for movie_id in range(1, size + 1):
+        streams = []
+        for n in range(rnd.randint(1, 5)):
+            codec, channels = rnd.choice(AUDIO)
+            streams.append({
+                'id': f'{movie_id}-{n}',
+                'video': {'codec': rnd.choice(VIDEO_CODECS),
+                          'quality': rnd.choice(QUALITIES)},
+                'audio': {'codec': codec, 'channels': channels,
+                          'language': rnd.choice(LANGUAGES)},
+            })
+        catalog[movie_id] = {
+            'id': movie_id,
+            'title': f'{rnd.choice(TITLE_WORDS)} {movie_id}',
+            'category': rnd.choice(('drama', 'comedy', 'action')),
+            'streams': streams,
+        }
+    return catalog
+
+
+class MockStreamBox:
+    """Threaded HTTP server serving the StreamBox API from memory.
+
+    Counts requests and response bytes per endpoint (see stats() / reset()).
+    Use as a context manager or call start()/stop().
+    """
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 catalog_size=500, token_lifetime=TOKEN_LIFETIME, seed=1):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.token_lifetime = token_lifetime
+        self.catalog = build_catalog(catalog_size, seed)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self):
+        """Return {'requests': n, 'bytes': n, 'endpoints': {name: [requests, bytes]}}."""
+        with self._lock:
+            endpoints = {k: list(v) for k, v in self._stats.items()}
+        return {'requests': sum(v[0] for v in endpoints.values()),
+                'bytes': sum(v[1] for v in endpoints.values()),
+                'endpoints': endpoints}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def _record(self, endpoint, size):
+        with self._lock:
+            entry = self._stats.setdefault(endpoint, [0, 0])
+            entry[0] += 1
+            entry[1] += size
+
+    def _delay(self):
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        return fail
+
+    # --- Endpoint implementations: return (status, body) ---
+
+    def _page(self, movies, query):
+        page = max(1, int(query.get('page', 1)))
+        size = max(1, int(query.get('size', 20)))
+        text = query.get('query', '').lower()
+        if text:
+            movies = [m for m in movies if text in m['title'].lower()]
+        items = [{'id': m['id'], 'title': m['title']}
+                 for m in movies[(page - 1) * size:page * size]]
+        return {'items': items, 'total': len(movies), 'page': page,
+                'pageCount': max(1, -(-len(movies) // size))}
+
+    def route(self, method, path, query, body, bearer=''):
+        if path == '/auth/login' and method == 'POST':
+            if not body.get('email') or not body.get('password'):
+                return 401, {'message': 'Invalid credentials'}
+            return 200, {'accessToken': make_token(self.token_lifetime),
+                         'refreshToken': make_token(30 * 86400)}
+        if path == '/auth/refresh' and method == 'POST':
+            if token_expiry(bearer) < time.time():
+                return 401, {'message': 'Invalid refresh token'}
+            return 200, {'accessToken': make_token(self.token_lifetime),
+                         'refreshToken': make_token(30 * 86400)}
+        if token_expiry(bearer) < time.time():
+            return 401, {'message': 'Unauthorized'}
+        if path == '/movie/search' and method == 'POST':
+            return 200, self._page(list(self.catalog.values()), query)
+        match = re.fullmatch(r'/movie/category/([^/]+)', path)
+        if match and method == 'POST':
+            movies = [m for m in self.catalog.values() if m['category'] == match.group(1)]
+            return 200, self._page(movies, query)
+        match = re.fullmatch(r'/movie/(\d+)(/stream)?', path)
+        if match and int(match.group(1)) in self.catalog:
+            movie = self.catalog[int(match.group(1))]
+            if match.group(2) and method == 'POST':
+                return 200, movie['streams']
+            if not match.group(2) and method == 'GET':
+                return 200, {'id': movie['id'], 'title': movie['title']}
+        match = re.fullmatch(r'/stream/([^/]+)/play', path)
+        if match and method == 'GET':
+            return 200, {'link': f'{self.url}/media/{match.group(1)}.mkv'}
+        if path == '/user/me' and method == 'GET':
+            return 200, {'id': 'bench', 'firstName': 'Bench', 'lastName': 'Mark',
+                         'email': 'bench@example.com'}
+        return 404, {'message': 'Not found'}
+
+    def _handler_class(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out in separate writes; without this,
+            # Nagle plus the client's delayed ACK adds ~40 ms per response
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self, method):
+                url = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                try:
+                    body = json.loads(raw) if raw else {}
+                except ValueError:
+                    body = {}
+                endpoint = re.sub(r'/[\w-]*\d[\w-]*', '/{id}', url.path)
+
+                if api._delay():
+                    status, data = 503, {'message': 'Injected failure'}
+                else:
+                    bearer = self.headers.get('Authorization', '')[len('Bearer '):]
+                    status, data = api.route(method, url.path, query, body, bearer)
+
+                payload = json.dumps(data).encode()
+                etag = f'"{hashlib.md5(payload).hexdigest()}"'
+                if status == 200 and self.headers.get('If-None-Match') == etag:
+                    status, payload = 304, b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                if status in (200, 304) and url.path.startswith('/movie/'):
+                    self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(payload)
+                api._record(f'{method} {endpoint}', len(payload))
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_POST(self):
+                self._handle('POST')
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds added to every request')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='up to this many extra random seconds per request')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='share of requests answered with 503')
+    parser.add_argument('--catalog-size', type=int, default=500)
+    args = parser.parse_args()
+    api = MockStreamBox(args.port, args.latency, args.jitter, args.error_rate,
+                        args.catalog_size)
+    print(f'Mock StreamBox API on {api.url} ({len(api.catalog)} movies)')
+    api.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        api.stop()
+
+
+if __name__ == '__main__':
+    main()
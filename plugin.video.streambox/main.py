@@ -1,8 +1,16 @@
 """StreamBox – Kodi video addon entry point."""
 import sys
+import time
 
-from resources.lib.router import Router
+_STARTED = time.perf_counter()
+
+from resources.lib import startup  # noqa: E402
+
+startup.begin(_STARTED)
+
+from resources.lib.router import Router  # noqa: E402
 
 if __name__ == '__main__':
     router = Router(sys.argv)
     router.dispatch()
+    startup.report(router.action)
@@ -0,0 +1,84 @@
+"""In-process cache for the Addon instance, settings, profile path and profile files.
+
+A plugin invocation asks for these many times; without caching each call
+builds a new xbmcaddon.Addon, translates the profile path and re-reads files.
+Cached settings and files are invalidated when the file on disk changes
+(mtime/size), so other invocations' writes are still picked up.
+"""
+import os
+
+import xbmcaddon
+import xbmcvfs
+
+from resources.lib.constants import ADDON_ID
+
+_addon = None
+_profile_dir = None
+_settings = {}
+_settings_stamp = None
+_files = {}
+
+
+def _stamp(path):
+    """Return an (mtime_ns, size) tuple identifying the file's version, or None."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def get_addon():
+    """Return the shared Addon instance."""
+    global _addon
+    if _addon is None:
+        _addon = xbmcaddon.Addon(ADDON_ID)
+    return _addon
+
+
+def get_profile_dir():
+    """Return the addon's userdata directory, creating it if needed."""
+    global _profile_dir
+    if _profile_dir is None:
+        profile = xbmcvfs.translatePath(get_addon().getAddonInfo('profile'))
+        if not xbmcvfs.exists(profile):
+            xbmcvfs.mkdirs(profile)
+        _profile_dir = profile
+    return _profile_dir
+
+
+def get_setting(setting_id):
+    """Read a setting value as string, cached until settings.xml changes."""
+    global _settings_stamp
+    stamp = _stamp(os.path.join(get_profile_dir(), 'settings.xml'))
+    if stamp != _settings_stamp:
+        _settings.clear()
+        _settings_stamp = stamp
+    if setting_id not in _settings:
+        _settings[setting_id] = get_addon().getSetting(setting_id)
+    return _settings[setting_id]
+
+
+def load_file(path, loader):
+    """Return loader(path), cached until the file at path changes.
+
+    loader is only called when the file exists; a missing file yields None.
+    Results are cached per (path, loader), so one file can back several views.
+    """
+    key = (path, loader)
+    stamp = _stamp(path)
+    if stamp is None:
+        _files.pop(key, None)
+        return None
+    cached = _files.get(key)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    value = loader(path)
+    _files[key] = (stamp, value)
+    return value
+
+
+def invalidate_file(path):
+    """Forget every cached view of path (call after writing it)."""
+    for key in [k for k in _files if k[0] == path]:
+        del _files[key]
@@ -1,87 +1,210 @@
 """StreamBox API client with JWT authentication."""
 import json
-from urllib.request import Request, urlopen
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlencode
 from urllib.error import HTTPError
 
-import xbmcaddon
-
+from resources.lib import trace
+from resources.lib.addon_cache import get_profile_dir, get_setting
 from resources.lib.constants import (
-    ADDON_ID, SETTING_API_URL, SETTING_ITEMS_PER_PAGE,
-    DEFAULT_API_URL, DEFAULT_ITEMS_PER_PAGE,
+    SETTING_API_URL, SETTING_ITEMS_PER_PAGE, SETTING_CACHE_ENABLED,
+    SETTING_CACHE_MAX_SIZE, SETTING_PREFETCH, SETTING_PREFETCH_DEPTH,
+    DEFAULT_API_URL, DEFAULT_ITEMS_PER_PAGE, DEFAULT_CACHE_MAX_SIZE,
+    DEFAULT_PREFETCH_DEPTH, PREFETCH_MAX_CONCURRENT,
+    CACHE_ENDPOINTS, CACHE_STALE_TTL, RESPONSE_CACHE_FILE, SETTING_LOCAL_SEARCH,
 )
-from resources.lib.auth import load_tokens, refresh_tokens, login
+from resources.lib.auth import get_access_token, refresh_tokens, login
+from resources.lib.errors import AuthError
 from resources.lib.models import MovieSummary, MovieDetail, StreamItem
+from resources.lib.response_cache import ResponseCache
+from resources.lib.transport import get_pool
 from resources.lib.utils import log
 
-
-class AuthError(Exception):
-    """Raised when authentication fails and cannot be recovered."""
-    pass
+# Worker threads for running independent API calls concurrently
+MAX_WORKERS = 4
 
 
 class ApiClient:
     """HTTP client for the StreamBox REST API."""
 
-    def __init__(self):
-        addon = xbmcaddon.Addon(ADDON_ID)
-        self._base_url = (addon.getSetting(SETTING_API_URL) or DEFAULT_API_URL).rstrip('/')
-        self._per_page = int(addon.getSetting(SETTING_ITEMS_PER_PAGE) or DEFAULT_ITEMS_PER_PAGE)
+    def __init__(self, cache=True):
+        """cache=False skips the response cache and the title index (bulk sync)."""
+        self._base_url = (get_setting(SETTING_API_URL) or DEFAULT_API_URL).rstrip('/')
+        self._per_page = int(get_setting(SETTING_ITEMS_PER_PAGE) or DEFAULT_ITEMS_PER_PAGE)
+        self._pool = get_pool()
+        self._executor = None
+        self._cache = None
+        self._cache_ttls = []
+        self._prefetch_depth = 0
+        self._prefetch_slots = threading.BoundedSemaphore(PREFETCH_MAX_CONCURRENT)
+        self._index_titles = cache and get_setting(SETTING_LOCAL_SEARCH) != 'false'
+        if cache and get_setting(SETTING_CACHE_ENABLED) != 'false':
+            max_mb = int(get_setting(SETTING_CACHE_MAX_SIZE) or DEFAULT_CACHE_MAX_SIZE)
+            self._cache = ResponseCache(
+                os.path.join(get_profile_dir(), RESPONSE_CACHE_FILE),
+                max_bytes=max_mb * 1024 * 1024,
+                stale_ttl=CACHE_STALE_TTL,
+            )
+            for pattern, setting_id, default in CACHE_ENDPOINTS:
+                minutes = int(get_setting(setting_id) or default)
+                self._cache_ttls.append((re.compile(pattern), minutes * 60))
+            if get_setting(SETTING_PREFETCH) == 'true':
+                self._prefetch_depth = int(get_setting(SETTING_PREFETCH_DEPTH)
+                                           or DEFAULT_PREFETCH_DEPTH)
+
+    @property
+    def caches_responses(self):
+        return self._cache is not None
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the client's worker pool.
+
+        Returns a concurrent.futures.Future. Workers are joined when the
+        interpreter exits, so work submitted here finishes even after the
+        handler has returned to Kodi.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=MAX_WORKERS,
+                                                thread_name_prefix='streambox-api')
+        return self._executor.submit(fn, *args, **kwargs)
 
-    def _get_access_token(self):
-        tokens = load_tokens()
-        return tokens.get('accessToken', '')
+    def _cache_ttl(self, path):
+        for pattern, ttl in self._cache_ttls:
+            if pattern.match(path):
+                return ttl
+        return 0
 
-    def _request(self, method, path, params=None, body=None, retry=True):
-        """Make an authenticated request. Auto-refreshes token on 401."""
+    def _fetch(self, method, path, params=None, body=None, headers=None, retry=True):
+        """Make an authenticated request and return the raw Response.
+
+        Auto-refreshes token on 401.
+        """
         url = self._base_url + path
         if params:
             url += '?' + urlencode(params)
 
         log(f'API {method} {url}')
 
-        headers = {
+        access_token = get_access_token()
+        hdrs = {
             'Accept': 'application/json',
             'Content-Type': 'application/json',
-            'Authorization': f'Bearer {self._get_access_token()}',
+            'Authorization': f'Bearer {access_token}',
         }
+        if headers:
+            hdrs.update(headers)
 
         data = json.dumps(body).encode() if body else None
-        req = Request(url, data=data, headers=headers, method=method)
 
         try:
-            with urlopen(req, timeout=15) as resp:
-                return json.loads(resp.read().decode())
+            with trace.span('api', f'{method} {path}'):
+                # Every endpoint used here only reads, the POSTs included
+                return self._pool.request(method, url, body=data, headers=hdrs,
+                                          idempotent=True)
         except HTTPError as e:
             if e.code == 401 and retry:
                 log('Got 401, attempting token refresh')
-                if refresh_tokens():
-                    return self._request(method, path, params, body, retry=False)
+                if refresh_tokens(access_token):
+                    return self._fetch(method, path, params, body, headers, retry=False)
                 # Refresh failed, try full re-login
                 log('Refresh failed, attempting re-login')
                 success, _ = login()
                 if success:
-                    return self._request(method, path, params, body, retry=False)
+                    return self._fetch(method, path, params, body, headers, retry=False)
                 raise AuthError('Prihlaseni vyprselo, prihlaste se znovu')
             raise
 
+    def _request(self, method, path, params=None, body=None, fresh=False):
+        """Make a request, serving cacheable endpoints from the response cache.
+
+        Fresh entries are returned without touching the network. Stale ones
+        are returned immediately and revalidated on the worker pool.
+        fresh=True skips the cached entry and stores the server's answer.
+        """
+        ttl = self._cache_ttl(path) if self._cache and body is None else 0
+        if not ttl:
+            return self._fetch(method, path, params, body).json()
+
+        key = ResponseCache.make_key(method, self._base_url + path, params)
+        if fresh:
+            return self._revalidate(key, method, path, params, ttl)
+        with trace.span('cache', path):
+            entry = self._cache.get(key)
+        if entry and entry.fresh:
+            log(f'API {method} {path} served from cache')
+            return entry.json()
+        if entry and entry.usable:
+            log(f'API {method} {path} served stale, revalidating')
+            self.submit(self._revalidate_quietly, key, method, path, params, ttl, entry)
+            return entry.json()
+        return self._revalidate(key, method, path, params, ttl, entry)
+
+    def _revalidate(self, key, method, path, params, ttl, entry=None):
+        """Fetch (conditionally, if we hold validators) and update the cache."""
+        headers = entry.conditional_headers() if entry else None
+        resp = self._fetch(method, path, params, headers=headers)
+        if resp.status == 304 and entry:
+            self._cache.touch(key, ttl)
+            return entry.json()
+        self._cache.put(key, resp.body, resp.headers.get('ETag'),
+                        resp.headers.get('Last-Modified'), ttl)
+        return resp.json()
+
+    def _revalidate_quietly(self, *args):
+        try:
+            self._revalidate(*args)
+        except Exception as e:
+            log(f'Background revalidation failed: {e}')
+
     def _get(self, path, params=None):
         return self._request('GET', path, params=params)
 
-    def _post(self, path, params=None, body=None):
-        return self._request('POST', path, params=params, body=body)
+    def _post(self, path, params=None, body=None, fresh=False):
+        return self._request('POST', path, params=params, body=body, fresh=fresh)
 
     # --- Movie endpoints ---
 
-    def search_movies(self, query=None, page=1):
+    def search_movies(self, query=None, page=1, size=None):
         """POST /movie/search -> paginated MovieGetResponse"""
-        params = {'page': page, 'size': self._per_page}
+        params = {'page': page, 'size': size or self._per_page}
         if query:
             params['query'] = query
         data = self._post('/movie/search', params=params)
         movies = [MovieSummary(id=m['id'], title=m['title']) for m in data['items']]
+        self._add_to_title_index(movies)
         return movies, data['total'], data['page'], data['pageCount']
 
+    def prefetch_search_pages(self, current_page, total_pages, query=None):
+        """Warm the response cache with the pages following current_page.
+
+        No-op unless prefetch is enabled in settings. At most
+        PREFETCH_MAX_CONCURRENT pages are fetched at the same time.
+        """
+        last_page = min(total_pages, current_page + self._prefetch_depth)
+        for page in range(current_page + 1, last_page + 1):
+            self.submit(self._prefetch_search_page, query, page)
+
+    def _prefetch_search_page(self, query, page):
+        with self._prefetch_slots:
+            try:
+                self.search_movies(query=query, page=page)
+            except Exception as e:
+                log(f'Prefetch of page {page} failed: {e}')
+
+    def _add_to_title_index(self, movies):
+        """Feed listing titles to the local search index, off the caller's path."""
+        if self._index_titles and movies:
+            from resources.lib.title_index import add_titles
+            entries = [(m.id, m.title) for m in movies]
+            try:
+                self.submit(add_titles, entries)
+            except RuntimeError:
+                # Called from a worker while the interpreter is shutting down
+                add_titles(entries)
+
     def get_movie(self, movie_id):
         """GET /movie/{id} -> MovieDetail"""
         data = self._get(f'/movie/{movie_id}')
@@ -92,14 +215,16 @@ class ApiClient:
         params = {'page': page, 'size': self._per_page}
         data = self._post(f'/movie/category/{category}', params=params)
         movies = [MovieSummary(id=m['id'], title=m['title']) for m in data['items']]
+        self._add_to_title_index(movies)
         return movies, data['total'], data['page'], data['pageCount']
 
-    def get_movie_streams(self, movie_id):
+    def get_movie_streams(self, movie_id, fresh=False):
         """POST /movie/{id}/stream -> plain list of available streams.
 
         Response: [{id, video: {codec, quality}, audio: {codec, channels, language}}, ...]
+        fresh=True bypasses the response cache.
         """
-        data = self._post(f'/movie/{movie_id}/stream')
+        data = self._post(f'/movie/{movie_id}/stream', fresh=fresh)
         return [
             StreamItem(
                 id=str(s['id']),
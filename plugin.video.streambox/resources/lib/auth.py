@@ -1,36 +1,30 @@
 """Authentication module – login, token storage, refresh."""
+import base64
 import json
 import os
-from urllib.request import Request, urlopen
+import threading
+import time
+from contextlib import contextmanager
 from urllib.error import HTTPError
 
-import xbmcaddon
 import xbmcvfs
 
+from resources.lib.addon_cache import (
+    get_profile_dir, get_setting, load_file, invalidate_file,
+)
 from resources.lib.constants import (
-    ADDON_ID, SETTING_API_URL, SETTING_EMAIL, SETTING_PASSWORD,
-    DEFAULT_API_URL, TOKENS_FILE,
+    SETTING_API_URL, SETTING_EMAIL, SETTING_PASSWORD,
+    DEFAULT_API_URL, TOKENS_FILE, TOKENS_LOCK_FILE,
+    TOKEN_REFRESH_MARGIN, TOKEN_LOCK_STALE, TOKEN_LOCK_WAIT,
 )
-from resources.lib.utils import log
-
-
-def _get_data_dir():
-    addon = xbmcaddon.Addon(ADDON_ID)
-    profile = xbmcvfs.translatePath(addon.getAddonInfo('profile'))
-    if not xbmcvfs.exists(profile):
-        xbmcvfs.mkdirs(profile)
-    return profile
+from resources.lib.utils import log, write_file_atomic
 
 
 def _tokens_path():
-    return os.path.join(_get_data_dir(), TOKENS_FILE)
+    return os.path.join(get_profile_dir(), TOKENS_FILE)
 
 
-def load_tokens():
-    """Load stored tokens from disk. Returns dict with accessToken/refreshToken or empty dict."""
-    path = _tokens_path()
-    if not xbmcvfs.exists(path):
-        return {}
+def _read_tokens(path):
     try:
         with xbmcvfs.File(path) as f:
             content = f.read()
@@ -40,15 +34,23 @@ def load_tokens():
         return {}
 
 
+def load_tokens():
+    """Load stored tokens from disk. Returns dict with accessToken/refreshToken or empty dict.
+
+    The parsed file is cached in-process until tokens.json changes on disk.
+    """
+    return dict(load_file(_tokens_path(), _read_tokens) or {})
+
+
 def save_tokens(access_token, refresh_token):
     """Persist tokens to disk."""
     path = _tokens_path()
     data = {'accessToken': access_token, 'refreshToken': refresh_token}
     try:
-        with xbmcvfs.File(path, 'w') as f:
-            f.write(json.dumps(data))
+        write_file_atomic(path, json.dumps(data))
     except Exception as e:
         log(f'Error saving tokens: {e}')
+    invalidate_file(path)
 
 
 def clear_tokens():
@@ -56,6 +58,28 @@ def clear_tokens():
     path = _tokens_path()
     if xbmcvfs.exists(path):
         xbmcvfs.delete(path)
+    invalidate_file(path)
+
+
+def _token_expiry(token):
+    """Return the JWT exp claim (unix time) of token, or None if not decodable."""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload)).get('exp')
+    except Exception:
+        return None
+
+
+def get_access_token():
+    """Return the stored access token, refreshing it shortly before it expires."""
+    access_token = load_tokens().get('accessToken', '')
+    expiry = _token_expiry(access_token) if access_token else None
+    if expiry is not None and expiry - time.time() < TOKEN_REFRESH_MARGIN:
+        log('Access token about to expire, refreshing')
+        if refresh_tokens(access_token):
+            access_token = load_tokens().get('accessToken', '')
+    return access_token
 
 
 def is_logged_in():
@@ -65,19 +89,18 @@ def is_logged_in():
 
 
 def _get_base_url():
-    addon = xbmcaddon.Addon(ADDON_ID)
-    return (addon.getSetting(SETTING_API_URL) or DEFAULT_API_URL).rstrip('/')
+    return (get_setting(SETTING_API_URL) or DEFAULT_API_URL).rstrip('/')
 
 
 def _post_json(url, data=None, headers=None):
     """POST JSON and return parsed response."""
+    # Imported here so checking login state does not load the HTTP stack
+    from resources.lib.transport import get_pool
     body = json.dumps(data).encode() if data else b''
     hdrs = {'Content-Type': 'application/json', 'Accept': 'application/json'}
     if headers:
         hdrs.update(headers)
-    req = Request(url, data=body, headers=hdrs, method='POST')
-    with urlopen(req, timeout=15) as resp:
-        return json.loads(resp.read().decode())
+    return get_pool().request('POST', url, body=body, headers=hdrs).json()
 
 
 def login(email=None, password=None):
@@ -85,9 +108,8 @@ def login(email=None, password=None):
 
     If email/password not provided, reads from addon settings.
     """
-    addon = xbmcaddon.Addon(ADDON_ID)
-    email = email or addon.getSetting(SETTING_EMAIL)
-    password = password or addon.getSetting(SETTING_PASSWORD)
+    email = email or get_setting(SETTING_EMAIL)
+    password = password or get_setting(SETTING_PASSWORD)
 
     if not email or not password:
         return False, 'Vyplnte email a heslo v nastaveni'
@@ -112,10 +134,65 @@ def login(email=None, password=None):
         return False, str(e)
 
 
-def refresh_tokens():
-    """Use refresh token to get new access/refresh tokens. Returns True on success."""
-    tokens = load_tokens()
-    refresh_token = tokens.get('refreshToken')
+_refresh_thread_lock = threading.Lock()
+
+
+@contextmanager
+def _refresh_lock():
+    """Hold the token refresh lock, shared by threads and plugin invocations.
+
+    Uses an O_EXCL lock file in the profile directory. A lock left behind by
+    a crashed invocation is broken after TOKEN_LOCK_STALE seconds; if the
+    lock cannot be taken within TOKEN_LOCK_WAIT we go ahead without it.
+    """
+    path = os.path.join(get_profile_dir(), TOKENS_LOCK_FILE)
+    with _refresh_thread_lock:
+        deadline = time.time() + TOKEN_LOCK_WAIT
+        acquired = False
+        while True:
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                acquired = True
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(path) > TOKEN_LOCK_STALE:
+                        log('Breaking stale token refresh lock')
+                        os.remove(path)
+                        continue
+                except OSError:
+                    continue
+            if time.time() > deadline:
+                log('Timed out waiting for token refresh lock')
+                break
+            time.sleep(0.1)
+        try:
+            yield
+        finally:
+            if acquired:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def refresh_tokens(stale_access_token=None):
+    """Use refresh token to get new access/refresh tokens. Returns True on success.
+
+    Refreshes are single-flight: concurrent callers wait for the running
+    refresh. If stale_access_token is given and the stored token no longer
+    matches it, another caller has already refreshed and its tokens are used.
+    """
+    with _refresh_lock():
+        tokens = load_tokens()
+        access_token = tokens.get('accessToken')
+        if stale_access_token and access_token and access_token != stale_access_token:
+            log('Tokens already refreshed by another invocation')
+            return True
+        return _do_refresh(tokens.get('refreshToken'))
+
+
+def _do_refresh(refresh_token):
     if not refresh_token:
         return False
 
@@ -130,5 +207,7 @@ def refresh_tokens():
         return True
     except Exception as e:
         log(f'Token refresh failed: {e}')
-        clear_tokens()
+        # Keep the tokens while the server is unreachable or waking up
+        if isinstance(e, HTTPError) and e.code < 500:
+            clear_tokens()
         return False
@@ -0,0 +1,215 @@
+"""Offline catalog snapshot: movie titles and stream lists in a local SQLite DB.
+
+The background service (service.py) pages through /movie/search without a
+query and upserts every movie into catalog.db, then refreshes the stream
+lists of a bounded number of movies per run, oldest first. Depending on the
+catalog.mode setting, listings, search and the stream dialog are served from
+the snapshot when the API is unreachable ('fallback') or always ('prefer');
+only /stream/{id}/play has to be live.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict
+from http.client import HTTPException
+from urllib.error import HTTPError
+
+from resources.lib import trace
+from resources.lib.addon_cache import get_profile_dir, get_setting
+from resources.lib.constants import (
+    CATALOG_FILE, CATALOG_PAGE_SIZE, CATALOG_STREAMS_PER_SYNC, CATALOG_STREAMS_TTL,
+    CATALOG_SYNC_INTERVAL, CATALOG_RETRY_INTERVAL,
+    SETTING_ITEMS_PER_PAGE, DEFAULT_ITEMS_PER_PAGE,
+)
+from resources.lib.utils import log
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS movies(
+    id PRIMARY KEY, title TEXT, folded TEXT, position INTEGER, seen INTEGER);
+CREATE INDEX IF NOT EXISTS movies_position ON movies(position);
+CREATE TABLE IF NOT EXISTS streams(
+    movie_id PRIMARY KEY, data TEXT, fetched REAL);
+CREATE TABLE IF NOT EXISTS meta(key TEXT PRIMARY KEY, value);
+'''
+
+_conn = None
+_lock = threading.RLock()
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        path = os.path.join(get_profile_dir(), CATALOG_FILE)
+        conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(_SCHEMA)
+        _conn = conn
+    return _conn
+
+
+def _get_meta(db, key, default=None):
+    row = db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else default
+
+
+def _set_meta(db, key, value):
+    db.execute('INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)', (key, value))
+
+
+def _normalize_id(movie_id):
+    """Plugin URLs carry ids as strings; the API (and this DB) uses ints."""
+    try:
+        return int(movie_id)
+    except (ValueError, TypeError):
+        return movie_id
+
+
+def is_unreachable(error):
+    """True if error means the API is down or still waking up, not refusing us."""
+    if isinstance(error, HTTPError):
+        return error.code >= 500
+    return isinstance(error, (OSError, HTTPException))
+
+
+def has_snapshot():
+    """True once a full sync has completed (cheap: no DB is created otherwise)."""
+    if _conn is None and not os.path.exists(os.path.join(get_profile_dir(), CATALOG_FILE)):
+        return False
+    with _lock:
+        return _get_meta(_db(), 'last_full_sync') is not None
+
+
+# --- Reading ---
+
+def search_movies(query=None, page=1, per_page=None):
+    """Same contract as ApiClient.search_movies, answered from the snapshot."""
+    from resources.lib.models import MovieSummary
+    from resources.lib.title_index import tokenize
+
+    per_page = per_page or int(get_setting(SETTING_ITEMS_PER_PAGE) or DEFAULT_ITEMS_PER_PAGE)
+    where, args = [], []
+    for word in tokenize(query or ''):
+        where.append("folded LIKE ? ESCAPE '\\'")
+        escaped = word.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        args.append(f'%{escaped}%')
+    clause = ('WHERE ' + ' AND '.join(where)) if where else ''
+    with _lock, trace.span('catalog', 'search'):
+        db = _db()
+        total = db.execute(f'SELECT COUNT(*) FROM movies {clause}', args).fetchone()[0]
+        rows = db.execute(
+            f'SELECT id, title FROM movies {clause} ORDER BY position LIMIT ? OFFSET ?',
+            args + [per_page, (page - 1) * per_page]).fetchall()
+    movies = [MovieSummary(id=movie_id, title=title) for movie_id, title in rows]
+    return movies, total, page, max(1, -(-total // per_page))
+
+
+def get_movie(movie_id):
+    """Return a MovieDetail for a movie in the snapshot, or None."""
+    from resources.lib.models import MovieDetail
+
+    movie_id = _normalize_id(movie_id)
+    with _lock:
+        row = _db().execute('SELECT title FROM movies WHERE id = ?', (movie_id,)).fetchone()
+    return MovieDetail(id=movie_id, title=row[0]) if row else None
+
+
+def get_movie_streams(movie_id):
+    """Return the stored StreamItem list for a movie, or None if not synced."""
+    from resources.lib.models import StreamItem
+
+    with _lock, trace.span('catalog', 'streams'):
+        row = _db().execute('SELECT data FROM streams WHERE movie_id = ?',
+                            (_normalize_id(movie_id),)).fetchone()
+    if row is None:
+        return None
+    return [StreamItem(**s) for s in json.loads(row[0])]
+
+
+# --- Sync (background service) ---
+
+def sync_due():
+    """True if the movie list is older than CATALOG_SYNC_INTERVAL.
+
+    A failed attempt is retried after CATALOG_RETRY_INTERVAL rather than on
+    every check.
+    """
+    with _lock:
+        db = _db()
+        now = time.time()
+        return (now - (_get_meta(db, 'last_full_sync') or 0) >= CATALOG_SYNC_INTERVAL
+                and now - (_get_meta(db, 'last_attempt') or 0) >= CATALOG_RETRY_INTERVAL)
+
+
+def sync_movies(api, should_stop):
+    """Page through /movie/search and replace the snapshot's movie list.
+
+    Movies are upserted page by page; ones missing from a complete pass are
+    deleted together with their streams. should_stop() is polled between
+    pages; an interrupted pass keeps the previous snapshot's leftovers.
+    """
+    from resources.lib.title_index import fold
+
+    db = _db()
+    with _lock, db:
+        _set_meta(db, 'last_attempt', time.time())
+    sync_id = int(time.time())
+    page, pages, count = 1, 1, 0
+    start = time.monotonic()
+    while page <= pages:
+        if should_stop():
+            return
+        movies, _, _, pages = api.search_movies(page=page, size=CATALOG_PAGE_SIZE)
+        rows = [(_normalize_id(m.id), m.title, fold(m.title),
+                 (page - 1) * CATALOG_PAGE_SIZE + n, sync_id)
+                for n, m in enumerate(movies)]
+        with _lock, db:
+            db.executemany(
+                'INSERT INTO movies(id, title, folded, position, seen) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(id) DO UPDATE SET title = excluded.title, '
+                'folded = excluded.folded, position = excluded.position, seen = excluded.seen',
+                rows)
+        count += len(rows)
+        page += 1
+
+    with _lock, db:
+        removed = db.execute('DELETE FROM movies WHERE seen != ?', (sync_id,)).rowcount
+        db.execute('DELETE FROM streams WHERE movie_id NOT IN (SELECT id FROM movies)')
+        _set_meta(db, 'last_full_sync', time.time())
+    log(f'Catalog: {count} movies synced ({removed} removed) in '
+        f'{time.monotonic() - start:.1f}s')
+
+
+def refresh_streams(api, should_stop):
+    """Fetch stream lists that are missing or older than CATALOG_STREAMS_TTL.
+
+    At most CATALOG_STREAMS_PER_SYNC movies per call, never-fetched ones
+    first, so a large catalog fills in over several service checks.
+    """
+    db = _db()
+    with _lock:
+        due = [row[0] for row in db.execute(
+            'SELECT m.id FROM movies m LEFT JOIN streams s ON s.movie_id = m.id '
+            'WHERE s.fetched IS NULL OR s.fetched < ? '
+            'ORDER BY s.fetched IS NOT NULL, s.fetched, m.position LIMIT ?',
+            (time.time() - CATALOG_STREAMS_TTL, CATALOG_STREAMS_PER_SYNC))]
+    refreshed = 0
+    for movie_id in due:
+        if should_stop():
+            break
+        try:
+            streams = api.get_movie_streams(movie_id)
+        except Exception as e:
+            log(f'Catalog: streams of movie {movie_id} failed: {e}')
+            if is_unreachable(e):
+                break
+            continue
+        data = json.dumps([asdict(s) for s in streams], separators=(',', ':'))
+        with _lock, db:
+            db.execute('INSERT OR REPLACE INTO streams(movie_id, data, fetched) '
+                       'VALUES (?, ?, ?)', (movie_id, data, time.time()))
+        refreshed += 1
+    if due:
+        log(f'Catalog: stream lists of {refreshed}/{len(due)} movies refreshed')
@@ -10,20 +10,87 @@ SETTING_PASSWORD = 'auth.password'
 SETTING_LANGUAGE = 'general.language'
 SETTING_ITEMS_PER_PAGE = 'general.items_per_page'
 SETTING_QUALITY = 'playback.quality'
+SETTING_SELECT_STREAM = 'playback.select_stream'
+SETTING_CACHE_ENABLED = 'cache.enabled'
+SETTING_CACHE_LISTING_TTL = 'cache.listing_ttl'
+SETTING_CACHE_DETAIL_TTL = 'cache.detail_ttl'
+SETTING_CACHE_STREAMS_TTL = 'cache.streams_ttl'
+SETTING_CACHE_MAX_SIZE = 'cache.max_size'
+SETTING_PREFETCH = 'cache.prefetch'
+SETTING_PREFETCH_DEPTH = 'cache.prefetch_depth'
+SETTING_LOCAL_SEARCH = 'search.local_index'
+SETTING_CATALOG_MODE = 'catalog.mode'
+SETTING_STARTUP_TIMING = 'debug.startup_timing'
+SETTING_TRACE = 'debug.trace'
+SETTING_PROFILE = 'debug.profile'
 
 # Default values
 DEFAULT_API_URL = 'https://streambox-api.onrender.com'
 DEFAULT_ITEMS_PER_PAGE = 20
 DEFAULT_LANGUAGE = 'cs'
 DEFAULT_QUALITY = 'auto'
+DEFAULT_CACHE_LISTING_TTL = 10  # minutes
+DEFAULT_CACHE_DETAIL_TTL = 60  # minutes
+DEFAULT_CACHE_STREAMS_TTL = 60  # minutes
+DEFAULT_CACHE_MAX_SIZE = 20  # MB
+
+# Response cache: endpoint path pattern -> TTL setting (first match wins).
+# Endpoints not listed here (auth, /stream/{id}/play, /user/me) are never cached.
+CACHE_ENDPOINTS = (
+    (r'^/movie/[^/]+/stream$', SETTING_CACHE_STREAMS_TTL, DEFAULT_CACHE_STREAMS_TTL),
+    (r'^/movie/search$', SETTING_CACHE_LISTING_TTL, DEFAULT_CACHE_LISTING_TTL),
+    (r'^/movie/category/[^/]+$', SETTING_CACHE_LISTING_TTL, DEFAULT_CACHE_LISTING_TTL),
+    (r'^/movie/[^/]+$', SETTING_CACHE_DETAIL_TTL, DEFAULT_CACHE_DETAIL_TTL),
+)
+# Watch history entries kept in the library DB
+HISTORY_MAX_ITEMS = 5000
+
+# Refresh the access token this many seconds before its JWT exp claim
+TOKEN_REFRESH_MARGIN = 60
+# A refresh lock older than this is considered abandoned by a dead process
+TOKEN_LOCK_STALE = 30
+# How long to wait for another invocation's refresh before going ahead anyway
+TOKEN_LOCK_WAIT = 20
+
+# Speculative next-page prefetch
+DEFAULT_PREFETCH_DEPTH = 1
+PREFETCH_MAX_CONCURRENT = 2
+# How long past expiry a cached response may still be served while refreshing
+CACHE_STALE_TTL = 24 * 3600
+
+# Local title index: titles kept, hits shown, and how long a search waits
+# for the server before showing local hits first
+TITLE_INDEX_MAX = 20000
+TITLE_INDEX_RESULTS = 50
+LOCAL_SEARCH_WAIT = 0.4  # seconds
+
+# Offline catalog snapshot (catalog.mode setting values, see catalog.py)
+CATALOG_MODE_OFF = 'off'
+CATALOG_MODE_FALLBACK = 'fallback'
+CATALOG_MODE_PREFER = 'prefer'
+CATALOG_SYNC_INTERVAL = 6 * 3600  # full movie list pass
+CATALOG_RETRY_INTERVAL = 1800  # after a failed or interrupted pass
+CATALOG_CHECK_INTERVAL = 600  # service wake-up; also refreshes a batch of streams
+CATALOG_PAGE_SIZE = 100
+CATALOG_STREAMS_PER_SYNC = 100
+CATALOG_STREAMS_TTL = 3 * 24 * 3600
 
 # Content types for xbmcplugin.setContent()
 CONTENT_MOVIES = 'movies'
 
 # Local storage filenames
+LIBRARY_DB_FILE = 'library.db'
+# Legacy JSON stores, migrated into LIBRARY_DB_FILE on first run
 FAVORITES_FILE = 'favorites.json'
 HISTORY_FILE = 'history.json'
 TOKENS_FILE = 'tokens.json'
+TOKENS_LOCK_FILE = 'tokens.lock'
+RESPONSE_CACHE_FILE = 'http_cache.db'
+TITLE_INDEX_FILE = 'title_index.db'
+CATALOG_FILE = 'catalog.db'
+# cProfile dumps from debug.profile, newest PROFILES_KEEP are kept
+PROFILES_DIR = 'profiles'
+PROFILES_KEEP = 10
 
 # Router actions
 ACTION_HUB = 'hub'
@@ -0,0 +1,6 @@
+"""Exceptions shared across the StreamBox addon."""
+
+
+class AuthError(Exception):
+    """Raised when authentication fails and cannot be recovered."""
+    pass
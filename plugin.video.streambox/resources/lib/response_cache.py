@@ -0,0 +1,144 @@
+"""On-disk HTTP response cache (SQLite) with TTL, validators and LRU eviction."""
+import json
+import sqlite3
+import threading
+import time
+from urllib.parse import urlencode
+
+from resources.lib import trace
+from resources.lib.utils import log
+
+# A hit only rewrites the entry's access time once it is older than this, so
+# reads stay reads; LRU eviction does not need finer timestamps
+ACCESS_RESOLUTION = 3600
+
+
+class CacheEntry:
+    """Cached response body plus its validators."""
+
+    def __init__(self, body, etag, last_modified, expires, stale_until):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+        self.stale_until = stale_until
+
+    @property
+    def fresh(self):
+        return time.time() < self.expires
+
+    @property
+    def usable(self):
+        """True while the entry may still be served (stale-while-revalidate)."""
+        return time.time() < self.stale_until
+
+    def conditional_headers(self):
+        """Headers for a conditional request revalidating this entry."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def json(self):
+        with trace.span('json', f'{len(self.body)} B cached'):
+            return json.loads(self.body.decode())
+
+
+class ResponseCache:
+    """Response cache stored in a single SQLite file in the addon profile.
+
+    Entries are keyed by method, URL and sorted params. Each entry has a TTL
+    after which it is stale; stale entries may still be served for
+    ``stale_ttl`` seconds while the caller refreshes them. The total body
+    size is capped at ``max_bytes``; least recently used entries (to within
+    ACCESS_RESOLUTION) are evicted first.
+    """
+
+    def __init__(self, path, max_bytes, stale_ttl):
+        self._path = path
+        self._max_bytes = max_bytes
+        self._stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @staticmethod
+    def make_key(method, url, params=None):
+        key = f'{method} {url}'
+        if params:
+            key += '?' + urlencode(sorted(params.items()))
+        return key
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self._path, timeout=5, check_same_thread=False)
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses('
+                'key TEXT PRIMARY KEY, body BLOB, etag TEXT, last_modified TEXT, '
+                'expires REAL, accessed REAL, size INTEGER)')
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)')
+        return self._conn
+
+    def get(self, key):
+        """Return the CacheEntry stored under key (possibly stale) or None."""
+        try:
+            with self._lock:
+                db = self._db()
+                row = db.execute(
+                    'SELECT body, etag, last_modified, expires, accessed '
+                    'FROM responses WHERE key = ?', (key,)).fetchone()
+                if row is None:
+                    return None
+                now = time.time()
+                if now - (row[4] or 0) >= ACCESS_RESOLUTION:
+                    db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+                    db.commit()
+        except sqlite3.Error as e:
+            log(f'Response cache read error: {e}')
+            return None
+        body, etag, last_modified, expires, _ = row
+        return CacheEntry(body, etag, last_modified, expires, expires + self._stale_ttl)
+
+    def put(self, key, body, etag, last_modified, ttl):
+        """Store a response body and evict LRU entries over the size cap."""
+        now = time.time()
+        try:
+            with self._lock:
+                db = self._db()
+                db.execute(
+                    'INSERT OR REPLACE INTO responses'
+                    '(key, body, etag, last_modified, expires, accessed, size) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (key, body, etag, last_modified, now + ttl, now, len(body)))
+                self._evict(db)
+                db.commit()
+        except sqlite3.Error as e:
+            log(f'Response cache write error: {e}')
+
+    def touch(self, key, ttl):
+        """Extend an entry's lifetime after a 304 Not Modified."""
+        now = time.time()
+        try:
+            with self._lock:
+                db = self._db()
+                db.execute('UPDATE responses SET expires = ?, accessed = ? WHERE key = ?',
+                           (now + ttl, now, key))
+                db.commit()
+        except sqlite3.Error as e:
+            log(f'Response cache write error: {e}')
+
+    def _evict(self, db):
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self._max_bytes:
+            return
+        evicted = 0
+        for key, size in db.execute(
+                'SELECT key, size FROM responses ORDER BY accessed').fetchall():
+            if total <= self._max_bytes:
+                break
+            db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+            evicted += 1
+        log(f'Response cache: evicted {evicted} entries')
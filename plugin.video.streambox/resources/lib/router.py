@@ -1,8 +1,16 @@
-"""URL routing for StreamBox addon."""
+"""URL routing for StreamBox addon.
+
+Kodi starts a fresh interpreter for every plugin:// navigation, so modules
+that are only needed by some actions (API client, auth, storage, models) are
+imported inside the handlers that use them.
+"""
+import sys
+
 import xbmc
 import xbmcgui
 import xbmcplugin
 
+from resources.lib import trace
 from resources.lib.constants import (
     ACTION_HUB, ACTION_MOVIES_MENU, ACTION_SERIES_MENU,
     ACTION_LOGIN, ACTION_LOGOUT,
@@ -10,19 +18,17 @@ from resources.lib.constants import (
     ACTION_SEARCH, ACTION_SEARCH_RESULTS, ACTION_FAVORITES,
     ACTION_TOGGLE_FAVORITE, ACTION_HISTORY, ACTION_CLEAR_HISTORY,
     ACTION_RECOMMENDATIONS, ACTION_FILTER, ACTION_FILTER_SELECT,
-    CONTENT_MOVIES,
-)
-from resources.lib.api_client import ApiClient, AuthError
-from resources.lib.auth import is_logged_in, login, clear_tokens
-from resources.lib.models import MovieSummary
-from resources.lib.storage import (
-    get_favorites, toggle_favorite, get_history, add_to_history, clear_history,
+    CONTENT_MOVIES, SETTING_LOCAL_SEARCH, LOCAL_SEARCH_WAIT,
+    SETTING_CATALOG_MODE, CATALOG_MODE_OFF, CATALOG_MODE_FALLBACK, CATALOG_MODE_PREFER,
+    SETTING_QUALITY, SETTING_LANGUAGE, SETTING_SELECT_STREAM, DEFAULT_QUALITY, DEFAULT_LANGUAGE,
+    SETTING_ITEMS_PER_PAGE, DEFAULT_ITEMS_PER_PAGE,
 )
+from resources.lib.errors import AuthError
 from resources.lib.ui import (
-    create_movie_list_item, create_directory_item, add_movie_sort_methods,
-    add_next_page_item, notify,
+    DirectoryListing, create_movie_list_item, create_directory_item,
+    add_movie_sort_methods, add_next_page_item, notify,
 )
-from resources.lib.utils import build_url, parse_params, log
+from resources.lib.utils import build_url, get_setting, parse_params, log
 
 
 class Router:
@@ -31,12 +37,94 @@ class Router:
     def __init__(self, argv):
         self._base_url = argv[0]
         self._handle = int(argv[1])
-        self._params = parse_params(argv[2]) if len(argv) > 2 else {}
-        self._api = ApiClient()
+        self._query_string = argv[2] if len(argv) > 2 else ''
+        self._params = parse_params(self._query_string)
+        self.action = self._params.get('action', ACTION_HUB)
+        self._api_client = None
+        # Set once something on this page came from the offline catalog
+        self._from_catalog = False
+
+    @property
+    def _api(self):
+        """ApiClient, built on first use so offline actions never load it."""
+        if self._api_client is None:
+            from resources.lib.api_client import ApiClient
+            self._api_client = ApiClient()
+        return self._api_client
+
+    # ---- Offline catalog ----
+
+    def _catalog(self, prefer_only=False):
+        """Return the catalog module if catalog.mode allows using it, else None.
+
+        With prefer_only, only for 'prefer' mode, where the snapshot is used
+        even though the API may be reachable.
+        """
+        mode = get_setting(SETTING_CATALOG_MODE) or CATALOG_MODE_OFF
+        if mode == CATALOG_MODE_OFF or (prefer_only and mode != CATALOG_MODE_PREFER):
+            return None
+        from resources.lib import catalog
+
+        return catalog if catalog.has_snapshot() else None
+
+    def _fall_back(self, error):
+        """Return the catalog module if error should be answered from it, else None."""
+        if get_setting(SETTING_CATALOG_MODE) != CATALOG_MODE_FALLBACK:
+            return None
+        from resources.lib import catalog
+
+        if not catalog.is_unreachable(error) or not catalog.has_snapshot():
+            return None
+        log(f'API unreachable ({error}), using the offline catalog', xbmc.LOGWARNING)
+        if not self._from_catalog:
+            notify('StreamBox', 'Server nedostupny, zobrazuji offline katalog')
+        self._from_catalog = True
+        return catalog
+
+    def _search_movies(self, query=None, page=1, pending=None):
+        """ApiClient.search_movies, answered from the offline catalog per catalog.mode.
+
+        pending is a finished Future of ApiClient.search_movies for the same
+        query and page, used instead of a new request.
+        """
+        catalog = self._catalog(prefer_only=True)
+        if catalog:
+            self._from_catalog = True
+            return catalog.search_movies(query, page)
+        try:
+            if pending is not None:
+                return pending.result()
+            return self._api.search_movies(query=query, page=page)
+        except Exception as e:
+            catalog = self._fall_back(e)
+            if catalog is None:
+                raise
+            return catalog.search_movies(query, page)
+
+    def _movie_streams(self, movie_id):
+        """ApiClient.get_movie_streams, answered from the offline catalog per catalog.mode."""
+        catalog = self._catalog(prefer_only=True)
+        streams = catalog.get_movie_streams(movie_id) if catalog else None
+        if streams is not None:
+            self._from_catalog = True
+            return streams
+        try:
+            return self._api.get_movie_streams(movie_id)
+        except Exception as e:
+            catalog = self._fall_back(e)
+            streams = catalog.get_movie_streams(movie_id) if catalog else None
+            if streams is None:
+                raise
+            return streams
+
+    def _catalog_movie(self, movie_id):
+        """MovieDetail from the offline catalog (any mode but off), or None."""
+        catalog = self._catalog()
+        return catalog.get_movie(movie_id) if catalog else None
 
     def dispatch(self):
         """Route to the appropriate handler based on 'action' parameter."""
-        action = self._params.get('action', ACTION_HUB)
+        action = self.action
 
         handlers = {
             ACTION_HUB: self._hub,
@@ -60,39 +148,49 @@ class Router:
 
         handler = handlers.get(action)
         if handler:
+            trace.begin(action)
             try:
                 handler()
             except AuthError as e:
                 notify('StreamBox', str(e), xbmcgui.NOTIFICATION_ERROR)
                 xbmcplugin.endOfDirectory(self._handle, succeeded=False)
+            finally:
+                trace.end()
         else:
             log(f'Unknown action: {action}', xbmc.LOGWARNING)
 
+        transport = sys.modules.get('resources.lib.transport')
+        if transport:
+            transport.get_pool().log_stats()
+
     # ---- Hub ----
 
     def _hub(self):
-        items = []
+        from resources.lib.auth import is_logged_in
+
+        # Depends on login state, so never reuse a cached copy
+        listing = DirectoryListing(self._handle, cache_to_disc=False)
 
         if is_logged_in():
-            items.append(create_directory_item('Filmy', self._base_url,
-                                               action=ACTION_MOVIES_MENU))
-            items.append(create_directory_item('Serialy', self._base_url,
-                                               action=ACTION_SERIES_MENU))
-            items.append(create_directory_item('Hledat', self._base_url,
-                                               action=ACTION_SEARCH))
-            items.append(create_directory_item('Odhlasit se', self._base_url,
-                                               action=ACTION_LOGOUT))
+            listing.add(create_directory_item('Filmy', self._base_url,
+                                              action=ACTION_MOVIES_MENU))
+            listing.add(create_directory_item('Serialy', self._base_url,
+                                              action=ACTION_SERIES_MENU))
+            listing.add(create_directory_item('Hledat', self._base_url,
+                                              action=ACTION_SEARCH))
+            listing.add(create_directory_item('Odhlasit se', self._base_url,
+                                              action=ACTION_LOGOUT))
         else:
-            items.append(create_directory_item('Prihlasit se', self._base_url,
-                                               action=ACTION_LOGIN))
+            listing.add(create_directory_item('Prihlasit se', self._base_url,
+                                              action=ACTION_LOGIN))
 
-        for url, li, is_folder in items:
-            xbmcplugin.addDirectoryItem(self._handle, url, li, isFolder=is_folder)
-        xbmcplugin.endOfDirectory(self._handle)
+        listing.finish()
 
     # ---- Auth ----
 
     def _login(self):
+        from resources.lib.auth import login
+
         success, msg = login()
         if success:
             notify('StreamBox', msg)
@@ -101,6 +199,8 @@ class Router:
         xbmc.executebuiltin('Container.Refresh')
 
     def _logout(self):
+        from resources.lib.auth import clear_tokens
+
         clear_tokens()
         notify('StreamBox', 'Odhlaseno')
         xbmc.executebuiltin('Container.Refresh')
@@ -108,17 +208,16 @@ class Router:
     # ---- Menus ----
 
     def _movies_menu(self):
-        items = [
+        listing = DirectoryListing(self._handle)
+        listing.add_all([
             create_directory_item('Vsechny filmy', self._base_url,
                                   action=ACTION_MOVIES),
             create_directory_item('Oblibene', self._base_url,
                                   action=ACTION_FAVORITES),
             create_directory_item('Historie', self._base_url,
                                   action=ACTION_HISTORY),
-        ]
-        for url, li, is_folder in items:
-            xbmcplugin.addDirectoryItem(self._handle, url, li, isFolder=is_folder)
-        xbmcplugin.endOfDirectory(self._handle)
+        ])
+        listing.finish()
 
     def _series_menu(self):
         notify('StreamBox', 'Serialy budou brzy k dispozici')
@@ -127,19 +226,31 @@ class Router:
     # ---- Movies ----
 
     def _movies(self):
+        from resources.lib.storage import get_favorite_ids
+
         page = int(self._params.get('page', 1))
-        movies, total, current_page, total_pages = self._api.search_movies(page=page)
+        movies, total, current_page, total_pages = self._search_movies(page=page)
 
         xbmcplugin.setContent(self._handle, CONTENT_MOVIES)
+        if self._from_catalog:
+            xbmcplugin.setPluginCategory(self._handle, 'Filmy (offline)')
         add_movie_sort_methods(self._handle)
 
-        for movie in movies:
-            url, li, is_folder = create_movie_list_item(movie, self._base_url)
-            xbmcplugin.addDirectoryItem(self._handle, url, li, isFolder=is_folder)
-
-        add_next_page_item(self._handle, self._base_url, current_page, total_pages,
+        # Rows carry the favorites state in their context menu, so never
+        # cache; later pages replace the listing instead of stacking up
+        listing = DirectoryListing(self._handle, cache_to_disc=False,
+                                   update_listing=current_page > 1)
+        favorite_ids = get_favorite_ids()
+        with trace.span('listitems', f'{len(movies)} movies'):
+            for movie in movies:
+                listing.add(create_movie_list_item(movie, self._base_url,
+                                                   favorite_ids=favorite_ids))
+
+        add_next_page_item(listing, self._base_url, current_page, total_pages,
                            action=ACTION_MOVIES)
-        xbmcplugin.endOfDirectory(self._handle)
+        listing.finish()
+        if not self._from_catalog:
+            self._api.prefetch_search_pages(current_page, total_pages)
 
     def _categories(self):
         # TODO: implement when backend has categories endpoint
@@ -147,43 +258,78 @@ class Router:
         xbmcplugin.endOfDirectory(self._handle, succeeded=False)
 
     def _movie_detail(self):
-        """Fetch streams, show select dialog, and play chosen stream."""
-        movie_id = self._params['movie_id']
-        streams = self._api.get_movie_streams(movie_id)
-
-        if not streams:
-            notify('StreamBox', 'Zadny stream nenalezen',
-                   xbmcgui.NOTIFICATION_ERROR)
-            return
-
-        # Single stream – play directly, no dialog
-        if len(streams) == 1:
-            selected = 0
-        else:
-            labels = [s.label for s in streams]
-            selected = xbmcgui.Dialog().select('Vybrat stream', labels)
+        """Fetch streams, pick the best one (or let the user choose) and play it."""
+        from resources.lib.storage import add_to_history
 
-        if selected < 0:
-            return
-
-        stream = streams[selected]
-        link = self._api.get_stream_play(stream.id)
+        movie_id = self._params['movie_id']
+        # Movie detail is only needed for history – fetch it alongside the
+        # streams instead of in front of playback.
+        movie = self._catalog_movie(movie_id)
+        movie_future = None if movie else self._api.submit(self._api.get_movie, movie_id)
+        streams = self._movie_streams(movie_id)
+
+        refetched = False
+        while True:
+            if not streams:
+                notify('StreamBox', 'Zadny stream nenalezen',
+                       xbmcgui.NOTIFICATION_ERROR)
+                return
+            stream = self._pick_stream(streams)
+            if stream is None:
+                return
+            try:
+                link = self._api.get_stream_play(stream.id)
+            except Exception as e:
+                gone = getattr(e, 'code', None) == 404
+                # A cached stream list may be a stale copy listing a stream
+                # that is gone by now: fetch the live list and pick again, once
+                if (gone and not refetched and not self._from_catalog
+                        and self._api.caches_responses):
+                    log(f'Stream {stream.id} is gone, refetching the stream list')
+                    streams = self._api.get_movie_streams(movie_id, fresh=True)
+                    refetched = True
+                    continue
+                # The offline catalog's list may be outdated as well
+                if not self._from_catalog and not gone:
+                    raise
+                log(f'Cannot resolve stream {stream.id}: {e}', xbmc.LOGWARNING)
+                link = None
+            break
 
         if not link:
             notify('StreamBox', 'Stream neni dostupny',
                    xbmcgui.NOTIFICATION_ERROR)
             return
 
-        # Record in history
+        # Play
+        li = xbmcgui.ListItem(path=link)
+        xbmc.Player().play(link, li)
+
+        # Record in history once playback has been started
         try:
-            movie = self._api.get_movie(movie_id)
+            if movie is None:
+                movie = movie_future.result()
             add_to_history({'id': movie.id, 'title': movie.title})
         except Exception:
             pass
 
-        # Play
-        li = xbmcgui.ListItem(path=link)
-        xbmc.Player().play(link, li)
+    def _pick_stream(self, streams):
+        """Rank streams and return the best one or the user's choice (None if cancelled)."""
+        from resources.lib.stream_rank import rank_streams
+
+        streams = rank_streams(streams,
+                               quality=get_setting(SETTING_QUALITY) or DEFAULT_QUALITY,
+                               language=get_setting(SETTING_LANGUAGE) or DEFAULT_LANGUAGE)
+        # Single stream or automatic choice – play the best one, no dialog
+        if len(streams) == 1 or not self._choose_stream():
+            log(f'Auto-selected stream {streams[0].label}')
+            return streams[0]
+        selected = xbmcgui.Dialog().select('Vybrat stream', [s.label for s in streams])
+        return streams[selected] if selected >= 0 else None
+
+    def _choose_stream(self):
+        """True if the user picks the stream (setting or 'Vybrat stream' context menu)."""
+        return self._params.get('select') == '1' or get_setting(SETTING_SELECT_STREAM) == 'true'
 
     # ---- Search ----
 
@@ -198,40 +344,122 @@ class Router:
             xbmcplugin.endOfDirectory(self._handle, succeeded=False)
 
     def _search_results(self):
+        from resources.lib.storage import get_favorite_ids
+
         query = self._params['query']
         page = int(self._params.get('page', 1))
 
-        movies, total, current_page, total_pages = self._api.search_movies(query=query, page=page)
+        local_hits = self._local_search(query) if page == 1 else None
+        if local_hits:
+            from concurrent.futures import wait
+
+            # Give the server a moment; a cached or quick answer wins outright.
+            # The future only ever holds a server result: _replace_listing
+            # reloads from the response cache, which a catalog answer is not in.
+            future = self._api.submit(self._api.search_movies, query=query, page=page)
+            if not wait([future], timeout=LOCAL_SEARCH_WAIT).done:
+                self._show_local_results(query, local_hits, future)
+                return
+            result = self._search_movies(query=query, page=page, pending=future)
+        else:
+            result = self._search_movies(query=query, page=page)
+        movies, total, current_page, total_pages = result
 
         xbmcplugin.setContent(self._handle, CONTENT_MOVIES)
-        xbmcplugin.setPluginCategory(self._handle, f'Hledani: {query}')
+        xbmcplugin.setPluginCategory(self._handle, f'Hledani: {query}'
+                                     + (' (offline)' if self._from_catalog else ''))
         add_movie_sort_methods(self._handle)
 
-        for movie in movies:
-            url, li, is_folder = create_movie_list_item(movie, self._base_url)
-            xbmcplugin.addDirectoryItem(self._handle, url, li, isFolder=is_folder)
-
-        add_next_page_item(self._handle, self._base_url, current_page, total_pages,
+        # Rows carry the favorites state in their context menu, so never
+        # cache; later pages replace the listing instead of stacking up
+        listing = DirectoryListing(self._handle, cache_to_disc=False,
+                                   update_listing=current_page > 1)
+        favorite_ids = get_favorite_ids()
+        with trace.span('listitems', f'{len(movies)} movies'):
+            for movie in movies:
+                listing.add(create_movie_list_item(movie, self._base_url,
+                                                   favorite_ids=favorite_ids))
+
+        add_next_page_item(listing, self._base_url, current_page, total_pages,
                            action=ACTION_SEARCH_RESULTS, query=query)
-        xbmcplugin.endOfDirectory(self._handle)
+        listing.finish()
+        if not self._from_catalog:
+            self._api.prefetch_search_pages(current_page, total_pages, query=query)
+
+    def _local_search(self, query):
+        """Return (id, title) hits from the local title index, if enabled.
+
+        Only used with the response cache on: the server result it waits
+        for must be in the cache when the listing is reloaded. Not needed
+        when the offline catalog answers searches anyway.
+        """
+        if get_setting(SETTING_LOCAL_SEARCH) == 'false' or not self._api.caches_responses:
+            return None
+        if self._catalog(prefer_only=True):
+            return None
+        from resources.lib.title_index import search
+
+        with trace.span('title index', query):
+            return search(query)
+
+    def _show_local_results(self, query, hits, future):
+        """List local hits now and swap in the server result once it arrives."""
+        from resources.lib.models import MovieSummary
+        from resources.lib.storage import get_favorite_ids
+
+        log(f'Server search slow, showing {len(hits)} local results for "{query}"')
+        xbmcplugin.setContent(self._handle, CONTENT_MOVIES)
+        xbmcplugin.setPluginCategory(self._handle, f'Hledani: {query} (nacitam...)')
+        add_movie_sort_methods(self._handle)
+
+        listing = DirectoryListing(self._handle, cache_to_disc=False)
+        favorite_ids = get_favorite_ids()
+        with trace.span('listitems', f'{len(hits)} local movies'):
+            for movie_id, title in hits:
+                listing.add(create_movie_list_item(MovieSummary(id=movie_id, title=title),
+                                                   self._base_url, favorite_ids=favorite_ids))
+        listing.finish()
+
+        url = build_url(self._base_url, action=ACTION_SEARCH_RESULTS, query=query, page=1)
+        future.add_done_callback(lambda f: self._replace_listing(f, url))
+
+    def _replace_listing(self, future, url):
+        """Reload the listing from url if the user is still looking at ours."""
+        if future.exception() is not None:
+            log(f'Server search failed: {future.exception()}', xbmc.LOGWARNING)
+            return
+        folder = xbmc.getInfoLabel('Container.FolderPath')
+        if parse_params(folder.partition('?')[2]) != parse_params(self._query_string):
+            return
+        # The response cache now holds the result, so the reload is instant
+        xbmc.executebuiltin(f'Container.Update({url},replace)')
 
     # ---- Favorites ----
 
     def _favorites(self):
+        from resources.lib.models import MovieSummary
+        from resources.lib.storage import get_favorites, get_favorite_ids
+
         favorites = get_favorites()
         xbmcplugin.setContent(self._handle, CONTENT_MOVIES)
         add_movie_sort_methods(self._handle)
 
-        for fav in favorites:
-            movie = MovieSummary(id=fav['id'], title=fav['title'])
-            url, li, is_folder = create_movie_list_item(movie, self._base_url)
-            xbmcplugin.addDirectoryItem(self._handle, url, li, isFolder=is_folder)
+        # Local state changes from context menu actions, so never cache
+        listing = DirectoryListing(self._handle, cache_to_disc=False)
+        favorite_ids = get_favorite_ids()
+        with trace.span('listitems', f'{len(favorites)} movies'):
+            for fav in favorites:
+                movie = MovieSummary(id=fav['id'], title=fav['title'])
+                listing.add(create_movie_list_item(movie, self._base_url,
+                                                   favorite_ids=favorite_ids))
 
-        xbmcplugin.endOfDirectory(self._handle)
+        listing.finish()
 
     def _toggle_favorite(self):
+        from resources.lib.storage import toggle_favorite
+
         movie_id = self._params['movie_id']
-        movie = self._api.get_movie(movie_id)
+        movie = self._catalog_movie(movie_id) or self._api.get_movie(movie_id)
         movie_data = {'id': movie.id, 'title': movie.title}
         added = toggle_favorite(movie_data)
         msg = 'Pridano do oblibenych' if added else 'Odebrano z oblibenych'
@@ -241,23 +469,38 @@ class Router:
     # ---- History ----
 
     def _history(self):
-        history = get_history()
-        xbmcplugin.setContent(self._handle, CONTENT_MOVIES)
+        from resources.lib.models import MovieSummary
+        from resources.lib.storage import get_history, count_history, get_favorite_ids
 
-        for entry in history:
-            movie = MovieSummary(id=entry['id'], title=entry['title'])
-            url, li, is_folder = create_movie_list_item(movie, self._base_url)
-            xbmcplugin.addDirectoryItem(self._handle, url, li, isFolder=is_folder)
+        # Up to HISTORY_MAX_ITEMS entries, so list them a page at a time
+        page = int(self._params.get('page', 1))
+        per_page = int(get_setting(SETTING_ITEMS_PER_PAGE) or DEFAULT_ITEMS_PER_PAGE)
+        history = get_history(limit=per_page, offset=(page - 1) * per_page)
+        total_pages = max(1, -(-count_history() // per_page))
+        xbmcplugin.setContent(self._handle, CONTENT_MOVIES)
 
-        if history:
+        listing = DirectoryListing(self._handle, cache_to_disc=False,
+                                   update_listing=page > 1)
+        favorite_ids = get_favorite_ids()
+        with trace.span('listitems', f'{len(history)} movies'):
+            for entry in history:
+                movie = MovieSummary(id=entry['id'], title=entry['title'])
+                listing.add(create_movie_list_item(movie, self._base_url,
+                                                   favorite_ids=favorite_ids))
+
+        add_next_page_item(listing, self._base_url, page, total_pages,
+                           action=ACTION_HISTORY)
+        if history and page == 1:
             url, li, _ = create_directory_item(
                 '[Vymazat historii]', self._base_url,
                 action=ACTION_CLEAR_HISTORY)
-            xbmcplugin.addDirectoryItem(self._handle, url, li, isFolder=False)
+            listing.add((url, li, False))
 
-        xbmcplugin.endOfDirectory(self._handle)
+        listing.finish()
 
     def _clear_history(self):
+        from resources.lib.storage import clear_history
+
         clear_history()
         notify('StreamBox', 'Historie vymazana')
         xbmc.executebuiltin('Container.Refresh')
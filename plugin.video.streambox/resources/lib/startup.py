@@ -0,0 +1,59 @@
+"""Cold-start measurement: import-time breakdown for one plugin invocation.
+
+Enabled by the debug.startup_timing setting. While active, every first-time
+import is timed through a builtins.__import__ wrapper; report() logs the
+total wall time of the invocation and the slowest modules (self time, i.e.
+excluding the modules they imported in turn).
+"""
+import builtins
+import sys
+import time
+
+from resources.lib.constants import SETTING_STARTUP_TIMING
+
+TOP_MODULES = 15
+
+_original_import = builtins.__import__
+_started = None
+_timings = []
+_stack = []
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    _stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - start
+        children = _stack.pop()
+        if _stack:
+            _stack[-1] += elapsed
+        _timings.append((name, elapsed, elapsed - children, len(_stack)))
+
+
+def begin(started):
+    """Start timing imports if enabled. started is perf_counter() at entry."""
+    global _started
+    from resources.lib.utils import get_setting
+    if get_setting(SETTING_STARTUP_TIMING) != 'true':
+        return
+    _started = started
+    builtins.__import__ = _timed_import
+
+
+def report(action=None):
+    """Log the import-time breakdown and stop timing."""
+    if _started is None:
+        return
+    builtins.__import__ = _original_import
+    from resources.lib.utils import log
+
+    total = time.perf_counter() - _started
+    imports = sum(t[1] for t in _timings if t[3] == 0)
+    log(f'Startup timing [{action}]: {total * 1000:.1f} ms total, '
+        f'{imports * 1000:.1f} ms in {len(_timings)} imports')
+    for name, inclusive, own, depth in sorted(_timings, key=lambda t: -t[2])[:TOP_MODULES]:
+        log(f'  {own * 1000:7.2f} ms self {inclusive * 1000:7.2f} ms cumulative  {name}')
@@ -1,63 +1,151 @@
-"""Local JSON storage for favorites and watch history."""
+"""Local SQLite storage for favorites and watch history."""
 import json
 import os
+import sqlite3
+import threading
 import time
+from contextlib import contextmanager
 
-import xbmcaddon
 import xbmcvfs
 
-from resources.lib.constants import ADDON_ID, FAVORITES_FILE, HISTORY_FILE
+from resources.lib import trace
+from resources.lib.addon_cache import get_profile_dir
+from resources.lib.constants import (
+    FAVORITES_FILE, HISTORY_FILE, LIBRARY_DB_FILE, HISTORY_MAX_ITEMS,
+)
 from resources.lib.utils import log
 
-
-def _get_data_dir():
-    """Return the addon's userdata directory, creating it if needed."""
-    addon = xbmcaddon.Addon(ADDON_ID)
-    profile = xbmcvfs.translatePath(addon.getAddonInfo('profile'))
-    if not xbmcvfs.exists(profile):
-        xbmcvfs.mkdirs(profile)
-    return profile
-
-
-def _read_json(filename):
-    """Read a JSON file from userdata, returning empty list on error."""
-    path = os.path.join(_get_data_dir(), filename)
-    if not xbmcvfs.exists(path):
-        return []
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS favorites(
+    id PRIMARY KEY, title TEXT, data TEXT, added_at REAL);
+CREATE INDEX IF NOT EXISTS favorites_added_at ON favorites(added_at);
+CREATE TABLE IF NOT EXISTS history(
+    id PRIMARY KEY, title TEXT, data TEXT, watched_at REAL);
+CREATE INDEX IF NOT EXISTS history_watched_at ON history(watched_at);
+'''
+
+_conn = None
+_lock = threading.RLock()
+_favorite_ids = None
+_batch_depth = 0
+
+
+def _db():
+    """Return the shared connection, creating the schema and migrating on first use."""
+    global _conn
+    if _conn is None:
+        path = os.path.join(get_profile_dir(), LIBRARY_DB_FILE)
+        conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(_SCHEMA)
+        _migrate_json(conn)
+        _conn = conn
+    return _conn
+
+
+@contextmanager
+def batch():
+    """Group storage mutations into a single transaction.
+
+    Mutations inside the block (including nested batch() blocks) are
+    committed together when the outermost block exits, so several changes in
+    one invocation cost one WAL flush. An exception rolls all of them back.
+    """
+    global _batch_depth
+    with _lock, trace.span('storage', 'write' if not _batch_depth else 'nested write'):
+        db = _db()
+        _batch_depth += 1
+        try:
+            yield db
+        except BaseException:
+            _batch_depth -= 1
+            if not _batch_depth:
+                db.rollback()
+            raise
+        _batch_depth -= 1
+        if not _batch_depth:
+            db.commit()
+
+
+def _load_json(path):
     try:
         with xbmcvfs.File(path) as f:
             content = f.read()
         return json.loads(content) if content else []
     except Exception as e:
-        log(f'Error reading {filename}: {e}')
+        log(f'Error reading {os.path.basename(path)}: {e}')
         return []
 
 
-def _write_json(filename, data):
-    """Write data to a JSON file in userdata."""
-    path = os.path.join(_get_data_dir(), filename)
+def _migrate_json(conn):
+    """Import favorites.json/history.json from older versions, once.
+
+    Migrated files are renamed to *.migrated so they are kept as a backup.
+    """
+    for filename, table, time_key in ((FAVORITES_FILE, 'favorites', 'added_at'),
+                                      (HISTORY_FILE, 'history', 'watched_at')):
+        path = os.path.join(get_profile_dir(), filename)
+        if not xbmcvfs.exists(path):
+            continue
+        entries = _load_json(path)
+        now = time.time()
+        with conn:
+            # Files are stored newest first; fall back to that order for timestamps
+            for i, entry in enumerate(entries):
+                conn.execute(
+                    f'INSERT OR IGNORE INTO {table}(id, title, data, {time_key}) '
+                    'VALUES (?, ?, ?, ?)',
+                    (_normalize_id(entry['id']), entry.get('title', ''),
+                     json.dumps(entry, ensure_ascii=False), entry.get(time_key, now - i)))
+        os.replace(path, path + '.migrated')
+        log(f'Migrated {len(entries)} entries from {filename}')
+
+
+def _normalize_id(movie_id):
+    # Compare as int to handle both string and int IDs
     try:
-        with xbmcvfs.File(path, 'w') as f:
-            f.write(json.dumps(data, ensure_ascii=False, indent=2))
-    except Exception as e:
-        log(f'Error writing {filename}: {e}')
+        return int(movie_id)
+    except (ValueError, TypeError):
+        return movie_id
+
+
+def _select(table, order_key, limit=-1, offset=0):
+    with _lock, trace.span('storage', f'select {table}'):
+        rows = _db().execute(
+            f'SELECT data FROM {table} ORDER BY {order_key} DESC LIMIT ? OFFSET ?',
+            (limit, offset)).fetchall()
+    return [json.loads(data) for data, in rows]
 
 
 # --- Favorites ---
 
 def get_favorites():
-    """Return list of favorite movie dicts."""
-    return _read_json(FAVORITES_FILE)
+    """Return list of favorite movie dicts (most recently added first)."""
+    return _select('favorites', 'added_at')
+
+
+def get_favorite_ids():
+    """Return the set of favorite movie ids.
+
+    Loaded once per invocation and reloaded only when another connection has
+    changed the database, so listings can check every row without a query.
+    """
+    global _favorite_ids
+    with _lock, trace.span('storage', 'favorite ids'):
+        db = _db()
+        version = db.execute('PRAGMA data_version').fetchone()[0]
+        if _favorite_ids is None or _favorite_ids[0] != version:
+            ids = frozenset(row[0] for row in db.execute('SELECT id FROM favorites'))
+            _favorite_ids = (version, ids)
+        return _favorite_ids[1]
 
 
-def is_favorite(movie_id):
+def is_favorite(movie_id, favorite_ids=None):
     """Check if a movie is in favorites."""
-    # Compare as int to handle both string and int IDs
-    try:
-        mid = int(movie_id)
-    except (ValueError, TypeError):
-        mid = movie_id
-    return any(m['id'] == mid for m in get_favorites())
+    if favorite_ids is None:
+        favorite_ids = get_favorite_ids()
+    return _normalize_id(movie_id) in favorite_ids
 
 
 def toggle_favorite(movie_data):
@@ -66,35 +154,51 @@ def toggle_favorite(movie_data):
     movie_data is a dict with at minimum {id, title, year, poster, rating, genre}.
     Returns True if added, False if removed.
     """
-    favorites = get_favorites()
-    existing = [i for i, m in enumerate(favorites) if m['id'] == movie_data['id']]
-    if existing:
-        favorites.pop(existing[0])
-        _write_json(FAVORITES_FILE, favorites)
-        return False
-    movie_data['added_at'] = time.time()
-    favorites.insert(0, movie_data)
-    _write_json(FAVORITES_FILE, favorites)
+    global _favorite_ids
+    movie_id = _normalize_id(movie_data['id'])
+    with batch() as db:
+        # PRAGMA data_version does not change for our own commits
+        _favorite_ids = None
+        if db.execute('DELETE FROM favorites WHERE id = ?', (movie_id,)).rowcount:
+            return False
+        movie_data['added_at'] = time.time()
+        db.execute(
+            'INSERT INTO favorites(id, title, data, added_at) VALUES (?, ?, ?, ?)',
+            (movie_id, movie_data.get('title', ''),
+             json.dumps(movie_data, ensure_ascii=False), movie_data['added_at']))
     return True
 
 
 # --- Watch History ---
 
-def get_history():
+def get_history(limit=-1, offset=0):
     """Return list of history entries (most recent first)."""
-    return _read_json(HISTORY_FILE)
+    return _select('history', 'watched_at', limit, offset)
+
+
+def count_history():
+    """Return the number of history entries."""
+    with _lock:
+        return _db().execute('SELECT COUNT(*) FROM history').fetchone()[0]
 
 
-def add_to_history(movie_data, max_items=100):
+def add_to_history(movie_data, max_items=HISTORY_MAX_ITEMS):
     """Add a movie to watch history. Deduplicates by id and caps at max_items."""
-    history = get_history()
-    history = [m for m in history if m['id'] != movie_data['id']]
     movie_data['watched_at'] = time.time()
-    history.insert(0, movie_data)
-    history = history[:max_items]
-    _write_json(HISTORY_FILE, history)
+    with batch() as db:
+        db.execute(
+            'INSERT INTO history(id, title, data, watched_at) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(id) DO UPDATE SET title = excluded.title, '
+            'data = excluded.data, watched_at = excluded.watched_at',
+            (_normalize_id(movie_data['id']), movie_data.get('title', ''),
+             json.dumps(movie_data, ensure_ascii=False), movie_data['watched_at']))
+        db.execute(
+            'DELETE FROM history WHERE watched_at < ('
+            'SELECT watched_at FROM history ORDER BY watched_at DESC LIMIT 1 OFFSET ?)',
+            (max_items - 1,))
 
 
 def clear_history():
     """Remove all watch history."""
-    _write_json(HISTORY_FILE, [])
+    with batch() as db:
+        db.execute('DELETE FROM history')
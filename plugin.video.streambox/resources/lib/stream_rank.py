@@ -0,0 +1,73 @@
+"""Order a movie's streams by the playback preferences.
+
+Streams are compared on, in this order: audio in the UI language
+(general.language, with a closely related language as second best), video
+quality against playback.quality, video codec, audio channels and audio
+codec. With quality 'auto' the highest resolution wins; with a fixed
+quality the best stream at or below it wins, and a higher one is only
+picked when nothing fits, the smallest overshoot first.
+"""
+import re
+
+from resources.lib.constants import DEFAULT_QUALITY
+
+# Quality labels without a pixel height in them
+QUALITY_HEIGHTS = {'8k': 4320, '4k': 2160, 'uhd': 2160, 'fhd': 1080, 'hd': 720, 'sd': 480}
+
+# Higher is better; unknown codecs rank below all listed ones
+VIDEO_CODEC_RANK = {'h264': 1, 'avc': 1, 'hevc': 2, 'h265': 2}
+AUDIO_CODEC_RANK = {'mp3': 1, 'aac': 2, 'ac3': 3, 'eac3': 4, 'dts': 4, 'truehd': 5}
+
+# ISO 639-2 and other spellings seen in stream metadata
+LANGUAGE_ALIASES = {'cze': 'cs', 'ces': 'cs', 'cz': 'cs', 'czech': 'cs',
+                    'slo': 'sk', 'slk': 'sk', 'slovak': 'sk',
+                    'eng': 'en', 'english': 'en'}
+# Second-best audio language for a UI language
+RELATED_LANGUAGES = {'cs': 'sk', 'sk': 'cs'}
+
+
+def quality_height(label):
+    """Return the pixel height of a quality label ('1080p', '4K'), 0 if unknown."""
+    label = (label or '').strip().casefold()
+    if label in QUALITY_HEIGHTS:
+        return QUALITY_HEIGHTS[label]
+    match = re.search(r'(\d{3,4})[pi]?\b', label)
+    return int(match.group(1)) if match else 0
+
+
+def _language(code):
+    code = (code or '').strip().casefold()
+    return LANGUAGE_ALIASES.get(code, code)
+
+
+def _quality_score(height, preferred):
+    if not height:
+        return 0, 0
+    if not preferred or height <= preferred:
+        return 2, height
+    return 1, -height
+
+
+def rank_streams(streams, quality=DEFAULT_QUALITY, language=''):
+    """Return streams sorted best first (stable for equally good streams)."""
+    preferred = 0 if quality == DEFAULT_QUALITY else quality_height(quality)
+    language = _language(language)
+    related = RELATED_LANGUAGES.get(language)
+
+    def key(stream):
+        audio_language = _language(stream.audio_language)
+        if language and audio_language == language:
+            language_score = 2
+        elif related and audio_language == related:
+            language_score = 1
+        else:
+            language_score = 0
+        return (
+            language_score,
+            _quality_score(quality_height(stream.video_quality), preferred),
+            VIDEO_CODEC_RANK.get(stream.video_codec.casefold(), 0),
+            stream.audio_channels or 0,
+            AUDIO_CODEC_RANK.get(stream.audio_codec.casefold(), 0),
+        )
+
+    return sorted(streams, key=key, reverse=True)
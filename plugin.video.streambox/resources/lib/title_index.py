@@ -0,0 +1,121 @@
+"""Local title index for instant search.
+
+Titles seen in search and category listings are kept in title_index.db in
+the profile, together with one (token, movie_id) row per word of the title,
+lowercased and with diacritics folded away. A query matches a title when
+every query word is a prefix of one of the title's words, so "pelisky" and
+"peli" both find "Pelíšky"; each word is one range scan over the token
+index. Only new and renamed titles are tokenized and written.
+"""
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+
+from resources.lib.addon_cache import get_profile_dir
+from resources.lib.constants import TITLE_INDEX_FILE, TITLE_INDEX_MAX, TITLE_INDEX_RESULTS
+from resources.lib.utils import log
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS titles(
+    id PRIMARY KEY, title TEXT, folded TEXT, seen INTEGER);
+CREATE INDEX IF NOT EXISTS titles_seen ON titles(seen);
+CREATE TABLE IF NOT EXISTS tokens(
+    token TEXT, movie_id, PRIMARY KEY(token, movie_id)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tokens_movie_id ON tokens(movie_id);
+'''
+
+_conn = None
+_lock = threading.RLock()
+
+
+def fold(text):
+    """Lowercase text and strip diacritics ("Pelíšky" -> "pelisky")."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def tokenize(text):
+    return sorted(set(re.findall(r'\w+', fold(text))))
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        path = os.path.join(get_profile_dir(), TITLE_INDEX_FILE)
+        conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(_SCHEMA)
+        _conn = conn
+    return _conn
+
+
+def add_titles(entries):
+    """Add (id, title) pairs to the index, writing only what changed.
+
+    New and renamed titles are (re)tokenized and marked most recently seen;
+    beyond TITLE_INDEX_MAX the least recently seen are dropped. A title seen
+    again is marked as well once it is in the older half of the index, i.e.
+    close to eviction; titles seen again while still recent cost no write.
+    """
+    titles = {movie_id: title for movie_id, title in entries if title}
+    if not titles:
+        return
+    try:
+        with _lock:
+            db = _db()
+            marks = ','.join('?' * len(titles))
+            known = {movie_id: (title, seen) for movie_id, title, seen in db.execute(
+                f'SELECT id, title, seen FROM titles WHERE id IN ({marks})', list(titles))}
+            newest = db.execute('SELECT COALESCE(MAX(seen), 0) FROM titles').fetchone()[0]
+            # Titles seen before this are in the half that is evicted first
+            aging = newest - TITLE_INDEX_MAX // 2
+            with db:
+                for movie_id, title in titles.items():
+                    old_title, seen = known.get(movie_id, (None, None))
+                    if old_title == title:
+                        if seen >= aging:
+                            continue
+                        newest += 1
+                        db.execute('UPDATE titles SET seen = ? WHERE id = ?', (newest, movie_id))
+                        continue
+                    newest += 1
+                    db.execute(
+                        'INSERT OR REPLACE INTO titles(id, title, folded, seen) '
+                        'VALUES (?, ?, ?, ?)', (movie_id, title, fold(title), newest))
+                    db.execute('DELETE FROM tokens WHERE movie_id = ?', (movie_id,))
+                    db.executemany('INSERT OR IGNORE INTO tokens(token, movie_id) VALUES (?, ?)',
+                                   [(token, movie_id) for token in tokenize(title)])
+                if len(titles) > len(known):
+                    _evict(db)
+    except sqlite3.Error as e:
+        log(f'Error writing {TITLE_INDEX_FILE}: {e}')
+
+
+def _evict(db):
+    excess = db.execute('SELECT COUNT(*) FROM titles').fetchone()[0] - TITLE_INDEX_MAX
+    if excess <= 0:
+        return
+    oldest = 'SELECT id FROM titles ORDER BY seen LIMIT ?'
+    db.execute(f'DELETE FROM tokens WHERE movie_id IN ({oldest})', (excess,))
+    db.execute(f'DELETE FROM titles WHERE id IN ({oldest})', (excess,))
+
+
+def search(query, limit=TITLE_INDEX_RESULTS):
+    """Return up to limit (id, title) pairs matching every word of query."""
+    words = tokenize(query)
+    if not words:
+        return []
+    matches = ' INTERSECT '.join(
+        ['SELECT movie_id FROM tokens WHERE token >= ? AND token < ?'] * len(words))
+    args = [bound for word in words for bound in (word, word + '\uffff')]
+    try:
+        with _lock:
+            return [tuple(row) for row in _db().execute(
+                f'SELECT id, title FROM titles WHERE id IN ({matches}) '
+                'ORDER BY folded LIMIT ?', args + [limit])]
+    except sqlite3.Error as e:
+        log(f'Error reading {TITLE_INDEX_FILE}: {e}')
+        return []
@@ -0,0 +1,146 @@
+"""Per-invocation tracing: a timed span tree for one Router.dispatch.
+
+Enabled by the debug.trace setting. dispatch() opens the root span for the
+action; API calls (with DNS, connect, time to first byte and body read from
+the transport), JSON decoding, storage queries and ListItem building open
+child spans, and end() logs the tree as a compact summary. Spans opened on
+worker threads hang off the root; those still running when dispatch()
+returns are left out. With debug.profile on as well, the invocation runs
+under cProfile and the stats are dumped to the profile directory.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from resources.lib.constants import (
+    SETTING_TRACE, SETTING_PROFILE, PROFILES_DIR, PROFILES_KEEP,
+)
+
+_root = None
+_profiler = None
+_local = threading.local()
+_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ('name', 'detail', 'start', 'duration', 'children')
+
+    def __init__(self, name, detail=''):
+        self.name = name
+        self.detail = detail
+        self.start = time.perf_counter()
+        self.duration = None
+        self.children = []
+
+
+def enabled():
+    return _root is not None
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _attach(child):
+    """Hang child off the current span; False if tracing ended meanwhile."""
+    stack = _stack()
+    with _lock:
+        root = _root
+        if root is None:
+            return False
+        (stack[-1] if stack else root).children.append(child)
+    return True
+
+
+@contextmanager
+def span(name, detail=''):
+    """Time the enclosed block as a child of the current span."""
+    if _root is None:
+        yield
+        return
+    current = Span(name, detail)
+    if not _attach(current):
+        yield
+        return
+    stack = _stack()
+    stack.append(current)
+    try:
+        yield
+    finally:
+        current.duration = time.perf_counter() - current.start
+        stack.pop()
+
+
+def add(name, seconds, detail=''):
+    """Record an already measured step as a child of the current span."""
+    if _root is None:
+        return
+    child = Span(name, detail)
+    child.duration = seconds
+    _attach(child)
+
+
+def begin(action):
+    """Start tracing this invocation if enabled in settings."""
+    global _root, _profiler
+    from resources.lib.utils import get_setting
+    if get_setting(SETTING_TRACE) != 'true':
+        return
+    _local.stack = []
+    _root = Span('dispatch', action)
+    if get_setting(SETTING_PROFILE) == 'true':
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+
+def _format(node, depth, lines):
+    if node.duration is None:
+        return
+    detail = f' {node.detail}' if node.detail else ''
+    lines.append(f'{"  " * depth}{node.name}{detail}: {node.duration * 1000:.1f} ms')
+    for child in node.children:
+        _format(child, depth + 1, lines)
+
+
+def _dump_profile(action):
+    from resources.lib.addon_cache import get_profile_dir
+    from resources.lib.utils import log
+
+    directory = os.path.join(get_profile_dir(), PROFILES_DIR)
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime('%Y%m%d-%H%M%S') + f'{int(time.time() * 1000) % 1000:03d}'
+    path = os.path.join(directory, f'{stamp}-{action}.prof')
+    _profiler.dump_stats(path)
+    dumps = sorted(f for f in os.listdir(directory) if f.endswith('.prof'))
+    for old in dumps[:-PROFILES_KEEP]:
+        os.remove(os.path.join(directory, old))
+    log(f'Profile written to {path}')
+
+
+def end():
+    """Log the span tree (and dump the profile) and stop tracing."""
+    global _root, _profiler
+    with _lock:
+        root, _root = _root, None
+    if root is None:
+        return
+    if _profiler is not None:
+        _profiler.disable()
+    root.duration = time.perf_counter() - root.start
+    from resources.lib.utils import log
+
+    lines = []
+    with _lock:
+        _format(root, 0, lines)
+    log('Trace ' + '\n    '.join(lines))
+    if _profiler is not None:
+        try:
+            _dump_profile(root.detail)
+        except OSError as e:
+            log(f'Cannot write profile: {e}')
+        _profiler = None
@@ -0,0 +1,209 @@
+"""Pooled HTTP/1.1 keep-alive transport shared by the API client and auth."""
+import io
+import json
+import select
+import socket
+import threading
+import time
+from http.client import HTTPConnection, HTTPSConnection, HTTPException
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+
+from resources.lib import trace
+from resources.lib.utils import log
+
+DEFAULT_TIMEOUT = 15
+MAX_IDLE_PER_HOST = 4
+
+# Errors that mean a kept-alive socket was closed by the server (or a proxy)
+# while it sat idle in the pool. The request is retried on a fresh connection
+# if it failed while being sent, or afterwards for idempotent requests only:
+# the server may already have acted on it.
+_STALE_ERRORS = (ConnectionResetError, BrokenPipeError, ConnectionAbortedError,
+                 HTTPException)
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+
+
+class Response:
+    """Fully read HTTP response."""
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        with trace.span('json', f'{len(self.body)} B'):
+            return json.loads(self.body.decode()) if self.body else None
+
+
+def _traced_connect(conn):
+    """Open conn now, recording DNS, TCP connect and TLS handshake times."""
+    steps = []
+
+    def create_connection(address, timeout=DEFAULT_TIMEOUT, source_address=None):
+        host, port = address
+        start = time.perf_counter()
+        infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        steps.append(('dns', time.perf_counter() - start))
+        start = time.perf_counter()
+        error = OSError(f'No address for {host}')
+        for info in infos:
+            try:
+                sock = socket.create_connection((info[4][0], port), timeout, source_address)
+                break
+            except OSError as e:
+                error = e
+        else:
+            raise error
+        steps.append(('tcp', time.perf_counter() - start))
+        return sock
+
+    conn._create_connection = create_connection
+    start = time.perf_counter()
+    conn.connect()
+    total = time.perf_counter() - start
+    for name, seconds in steps:
+        trace.add(name, seconds)
+    if isinstance(conn, HTTPSConnection):
+        trace.add('tls', total - sum(seconds for _, seconds in steps))
+
+
+def _is_dropped(conn):
+    """True if an idle connection's socket is closed or has unexpected data."""
+    if conn.sock is None:
+        return True
+    try:
+        readable, _, _ = select.select([conn.sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    # An idle keep-alive socket has nothing to read; EOF means the peer closed it
+    return bool(readable)
+
+
+class ConnectionPool:
+    """Keeps idle HTTP(S) connections per host and hands them out per request.
+
+    Thread-safe: every request checks a connection out of the pool and returns
+    it once the response body has been read, so concurrent callers never share
+    a socket.
+    """
+
+    def __init__(self, max_idle_per_host=MAX_IDLE_PER_HOST):
+        self._max_idle = max_idle_per_host
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'connections': 0, 'reused': 0, 'stale': 0}
+
+    def _acquire(self, scheme, netloc, timeout):
+        key = (scheme, netloc)
+        with self._lock:
+            idle = self._idle.get(key)
+            while idle:
+                conn = idle.pop()
+                if _is_dropped(conn):
+                    conn.close()
+                    self.stats['stale'] += 1
+                    continue
+                self.stats['reused'] += 1
+                return conn, True
+            self.stats['connections'] += 1
+        cls = HTTPSConnection if scheme == 'https' else HTTPConnection
+        return cls(netloc, timeout=timeout), False
+
+    def _release(self, scheme, netloc, conn):
+        key = (scheme, netloc)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self._max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, method, url, body=None, headers=None, timeout=DEFAULT_TIMEOUT,
+                idempotent=None):
+        """Send a request and return a Response.
+
+        Raises urllib's HTTPError for 4xx/5xx statuses so callers can keep
+        handling errors the same way they did with urlopen(). idempotent
+        (default: by method) allows a retry after the request was sent on a
+        connection that turned out to be stale.
+        """
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        parts = urlsplit(url)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        hdrs = {'Connection': 'keep-alive'}
+        if headers:
+            hdrs.update(headers)
+
+        with self._lock:
+            self.stats['requests'] += 1
+
+        while True:
+            conn, reused = self._acquire(parts.scheme, parts.netloc, timeout)
+            sent = False
+            try:
+                if not reused and trace.enabled():
+                    _traced_connect(conn)
+                start = time.perf_counter()
+                conn.request(method, target, body=body, headers=hdrs)
+                sent = True
+                resp = conn.getresponse()
+                first_byte = time.perf_counter()
+                data = resp.read()
+                trace.add('ttfb', first_byte - start, 'reused' if reused else '')
+                trace.add('body', time.perf_counter() - first_byte, f'{len(data)} B')
+            except _STALE_ERRORS as e:
+                conn.close()
+                if not reused or (sent and not idempotent):
+                    raise
+                # Stale pooled socket: drop it and try again on a new one
+                with self._lock:
+                    self.stats['stale'] += 1
+                log(f'Stale connection to {parts.netloc} ({e.__class__.__name__}), reconnecting')
+                continue
+            except Exception:
+                conn.close()
+                raise
+            break
+
+        if resp.will_close:
+            conn.close()
+        else:
+            self._release(parts.scheme, parts.netloc, conn)
+
+        if resp.status >= 400:
+            raise HTTPError(url, resp.status, resp.reason, resp.headers, io.BytesIO(data))
+        return Response(resp.status, resp.headers, data)
+
+    def close(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def log_stats(self):
+        """Log how many requests were served on reused connections."""
+        s = self.stats
+        if s['requests']:
+            ratio = 100 * s['reused'] / s['requests']
+            log(f'HTTP pool: {s["requests"]} requests, {s["connections"]} connections, '
+                f'{s["reused"]} reused ({ratio:.0f}%), {s["stale"]} stale')
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide connection pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
@@ -2,24 +2,31 @@
 import xbmcgui
 import xbmcplugin
 
-from resources.lib.storage import is_favorite
+from resources.lib import trace
 from resources.lib.utils import build_url
 
 
-def create_movie_list_item(movie, base_url, is_playable=False):
+def create_movie_list_item(movie, base_url, is_playable=False, favorite_ids=None):
     """Create a ListItem for a movie (MovieSummary or MovieDetail).
 
-    Returns (url, list_item, is_folder) tuple for addDirectoryItem.
+    Pass favorite_ids (from storage.get_favorite_ids()) when building a whole
+    listing so the favorites index is looked up once, not once per row.
+    Returns (url, list_item, is_folder) tuple for DirectoryListing.add.
     """
     li = xbmcgui.ListItem(label=movie.title, offscreen=True)
     li.setInfo('video', {'title': movie.title, 'mediatype': 'movie'})
 
     # Context menu
-    fav_label = 'Odebrat z oblibenych' if is_favorite(movie.id) else 'Pridat do oblibenych'
-    li.addContextMenuItems([(
-        fav_label,
-        f'RunPlugin({build_url(base_url, action="toggle_favorite", movie_id=movie.id)})',
-    )])
+    # storage (and sqlite3) is only loaded by handlers that list movies
+    from resources.lib.storage import is_favorite
+    fav_label = 'Odebrat z oblibenych' if is_favorite(movie.id, favorite_ids) else 'Pridat do oblibenych'
+    li.addContextMenuItems([
+        (fav_label,
+         f'RunPlugin({build_url(base_url, action="toggle_favorite", movie_id=movie.id)})'),
+        # Stream dialog even when the best stream is picked automatically
+        ('Vybrat stream',
+         f'RunPlugin({build_url(base_url, action="movie_detail", movie_id=movie.id, select=1)})'),
+    ])
 
     if is_playable:
         url = build_url(base_url, action='play', movie_id=movie.id)
@@ -45,15 +52,47 @@ def create_directory_item(label, base_url, icon=None, **params):
     return url, li, True
 
 
-def add_next_page_item(handle, base_url, current_page, total_pages, **extra_params):
-    """Add a 'Next page >>' item if there are more pages."""
+def add_next_page_item(listing, base_url, current_page, total_pages, **extra_params):
+    """Add a 'Next page >>' item to the listing if there are more pages."""
     if current_page < total_pages:
         li = xbmcgui.ListItem(
             label=f'Dalsi strana ({current_page + 1}/{total_pages}) >>',
             offscreen=True,
         )
         url = build_url(base_url, page=current_page + 1, **extra_params)
-        xbmcplugin.addDirectoryItem(handle, url, li, isFolder=True)
+        listing.add((url, li, True))
+
+
+class DirectoryListing:
+    """Collects directory rows and hands them to Kodi in one addDirectoryItems call.
+
+    cache_to_disc lets Kodi reuse the rendered directory on back navigation;
+    turn it off for listings that depend on local state (login, favorites,
+    history) or on modal input. update_listing replaces the current listing
+    in the navigation history instead of pushing a new one; paged listings
+    set it from page 2 on, so Back leaves the listing instead of paging back.
+    """
+
+    def __init__(self, handle, cache_to_disc=True, update_listing=False):
+        self._handle = handle
+        self._cache_to_disc = cache_to_disc
+        self._update_listing = update_listing
+        self._items = []
+
+    def add(self, item):
+        """Add a (url, list_item, is_folder) tuple."""
+        self._items.append(item)
+
+    def add_all(self, items):
+        self._items.extend(items)
+
+    def finish(self):
+        """Submit all rows and end the directory."""
+        with trace.span('kodi', f'{len(self._items)} items'):
+            if self._items:
+                xbmcplugin.addDirectoryItems(self._handle, self._items, len(self._items))
+            xbmcplugin.endOfDirectory(self._handle, cacheToDisc=self._cache_to_disc,
+                                      updateListing=self._update_listing)
 
 
 def notify(title, message, icon=xbmcgui.NOTIFICATION_INFO, time_ms=3000):
@@ -1,10 +1,12 @@
 """Utility functions for StreamBox addon."""
+import os
+import tempfile
 from urllib.parse import urlencode, parse_qs
 
 import xbmc
-import xbmcaddon
 
-from resources.lib.constants import TAG, ADDON_ID
+from resources.lib import addon_cache
+from resources.lib.constants import TAG
 
 
 def log(msg, level=xbmc.LOGINFO):
@@ -14,12 +16,12 @@ def log(msg, level=xbmc.LOGINFO):
 
 def get_addon():
     """Return the Addon instance."""
-    return xbmcaddon.Addon(ADDON_ID)
+    return addon_cache.get_addon()
 
 
 def get_setting(setting_id):
     """Read a setting value as string."""
-    return get_addon().getSetting(setting_id)
+    return addon_cache.get_setting(setting_id)
 
 
 def build_url(base_url, **params):
@@ -32,3 +34,24 @@ def parse_params(argv2):
     """Parse query string from sys.argv[2] into a dict with string values."""
     params = parse_qs(argv2.lstrip('?'))
     return {k: v[0] for k, v in params.items()}
+
+
+def write_file_atomic(path, content):
+    """Write text to path so readers see either the old or the new file.
+
+    The content goes to a temp file in the same directory, is fsynced and
+    then renamed over path, so a crash mid-write never leaves it truncated.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,36 @@
+"""StreamBox – background service keeping the offline catalog snapshot fresh."""
+import xbmc
+
+from resources.lib.addon_cache import get_setting
+from resources.lib.constants import (
+    SETTING_CATALOG_MODE, CATALOG_MODE_OFF, CATALOG_CHECK_INTERVAL,
+)
+from resources.lib.utils import log
+
+
+def run_once(monitor):
+    """Sync the catalog if it is enabled, we are logged in and a pass is due."""
+    from resources.lib import catalog
+    from resources.lib.api_client import ApiClient
+    from resources.lib.auth import is_logged_in
+
+    if (get_setting(SETTING_CATALOG_MODE) or CATALOG_MODE_OFF) == CATALOG_MODE_OFF:
+        return
+    if not is_logged_in():
+        return
+    api = ApiClient(cache=False)
+    try:
+        if catalog.sync_due():
+            catalog.sync_movies(api, monitor.abortRequested)
+        if catalog.has_snapshot():
+            catalog.refresh_streams(api, monitor.abortRequested)
+    except Exception as e:
+        log(f'Catalog sync failed: {e}', xbmc.LOGWARNING)
+
+
+if __name__ == '__main__':
+    monitor = xbmc.Monitor()
+    while not monitor.abortRequested():
+        run_once(monitor)
+        if monitor.waitForAbort(CATALOG_CHECK_INTERVAL):
+            break
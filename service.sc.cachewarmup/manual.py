@@ -1,23 +1,44 @@
-"""SC Cache Warmup – manual run entry point."""
+"""SC Cache Warmup – manual run entry point.
+
+RunScript(service.sc.cachewarmup) runs a warmup cycle now;
+RunScript(service.sc.cachewarmup,stats) shows the recorded cycle metrics.
+"""
+
+import sys
 
 import xbmcgui
 
-from resources.lib.warmup import run_warmup, ENDPOINTS
+from resources.lib.stats import load_cycles, summarize
+
+
+def show_stats():
+    xbmcgui.Dialog().textviewer('SC Cache Warmup – statistics', summarize(load_cycles()))
+
+
+def run():
+    from resources.lib.warmup import run_warmup
+
+    cached = run_warmup()
+    cycles = load_cycles()
+    total = cycles[-1]['total'] if cycles else cached
+
+    if cached > 0:
+        xbmcgui.Dialog().notification(
+            'SC Cache Warmup',
+            f'Done: {cached}/{total} endpoints cached',
+            xbmcgui.NOTIFICATION_INFO,
+            3000,
+        )
+    else:
+        xbmcgui.Dialog().notification(
+            'SC Cache Warmup',
+            'Warmup failed – check log',
+            xbmcgui.NOTIFICATION_ERROR,
+            5000,
+        )
 
-cached = run_warmup()
-total = len(ENDPOINTS)
 
-if cached > 0:
-    xbmcgui.Dialog().notification(
-        'SC Cache Warmup',
-        f'Done: {cached}/{total} endpoints cached',
-        xbmcgui.NOTIFICATION_INFO,
-        3000,
-    )
+if sys.argv[1:2] == ['stats']:
+    show_stats()
 else:
-    xbmcgui.Dialog().notification(
-        'SC Cache Warmup',
-        'Warmup failed – check log',
-        xbmcgui.NOTIFICATION_ERROR,
-        5000,
-    )
+    run()
@@ -0,0 +1,259 @@
+"""SC Cache Warmup – batched writer for the SimpleCache SQLite DB."""
+
+import sqlite3
+import time
+
+import xbmc
+
+from resources.lib.utils import log
+
+# How long we wait for the Stream Cinema addon's own locks before giving up
+BUSY_TIMEOUT_MS = 2000
+FLUSH_ATTEMPTS = 3
+# Only vacuum once at least this much of the file, and this share of it, is free
+VACUUM_MIN_BYTES = 1024 * 1024
+VACUUM_MIN_RATIO = 0.25
+# SQLite auto_vacuum mode that allows PRAGMA incremental_vacuum
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def compact_literal(value):
+    """Return a Python literal of value like repr(), minus the spaces after , and :.
+
+    Reads back to an equal object with eval() as well as ast.literal_eval(),
+    so any reader that handles repr() rows handles these.
+    """
+    return _literal(value, [0])
+
+
+def _literal(value, omitted):
+    """compact_literal(), adding the number of spaces left out to omitted[0]."""
+    if isinstance(value, dict):
+        omitted[0] += max(2 * len(value) - 1, 0)
+        return '{' + ','.join(f'{_literal(k, omitted)}:{_literal(v, omitted)}'
+                              for k, v in value.items()) + '}'
+    if isinstance(value, list):
+        omitted[0] += max(len(value) - 1, 0)
+        return '[' + ','.join(_literal(v, omitted) for v in value) + ']'
+    if isinstance(value, tuple):
+        omitted[0] += max(len(value) - 1, 0)
+        items = ','.join(_literal(v, omitted) for v in value)
+        return f'({items},)' if len(value) == 1 else f'({items})'
+    return repr(value)
+
+
+class CacheWriter:
+    """Keeps one connection to simplecache.db and writes a cycle in one transaction.
+
+    Rows are queued with add()/extend() and committed together by flush(), so
+    a cycle costs a single fsync. Entries whose content checksum matches the
+    stored row only get their expiry extended, skipping repr() and the
+    rewrite of the data blob. The DB is switched to WAL so the Stream Cinema
+    addon can keep reading while we write; our short busy_timeout plus
+    BEGIN IMMEDIATE means we back off instead of holding it up.
+    With compact_min_bytes set, payloads at least that large are stored as
+    a Python literal without repr()'s whitespace (see compact_literal()).
+    prune() and vacuum() keep the file from growing without bound.
+    """
+
+    def __init__(self, db_path, busy_timeout_ms=BUSY_TIMEOUT_MS, compact_min_bytes=None):
+        self._db_path = db_path
+        self._busy_timeout_ms = busy_timeout_ms
+        self._compact_min_bytes = compact_min_bytes
+        self._conn = None
+        self._pending = []
+        self._pending_size = 0
+        self._extend = []
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def open(self):
+        """Open the DB connection. Errors are logged; flush() then writes nothing."""
+        try:
+            self._conn = self._connect()
+        except Exception as e:
+            log(f'DB error: {e}', xbmc.LOGWARNING)
+
+    def _connect(self):
+        conn = sqlite3.connect(self._db_path, timeout=self._busy_timeout_ms / 1000,
+                               isolation_level=None)
+        conn.execute(f'PRAGMA busy_timeout = {int(self._busy_timeout_ms)}')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS simplecache('
+            'id TEXT UNIQUE, expires INTEGER, data TEXT, checksum INTEGER)')
+        try:
+            mode = conn.execute('PRAGMA journal_mode = WAL').fetchone()[0]
+        except sqlite3.OperationalError as e:
+            # Switching needs an exclusive lock; a reader holding the DB open
+            # (Stream Cinema) makes it fail. Try again on the next cycle.
+            mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+            log(f'Cannot switch cache DB to WAL ({e}), using journal_mode={mode}')
+            return conn
+        if mode.lower() == 'wal':
+            conn.execute('PRAGMA synchronous = NORMAL')
+        else:
+            log(f'WAL not available for cache DB, using journal_mode={mode}')
+        return conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def load_checksums(self, cache_keys):
+        """Return {cache_key: checksum} for the keys already stored in the DB."""
+        if self._conn is None or not cache_keys:
+            return {}
+        marks = ','.join('?' * len(cache_keys))
+        try:
+            return dict(self._conn.execute(
+                f'SELECT id, checksum FROM simplecache WHERE id IN ({marks})',
+                list(cache_keys)).fetchall())
+        except sqlite3.Error as e:
+            log(f'DB error: {e}', xbmc.LOGWARNING)
+            return {}
+
+    def encode(self, data):
+        """Return (text, plain_size): the data column text and the size of repr(data).
+
+        text is repr(data), or its compact_literal() form for large payloads.
+        """
+        if self._compact_min_bytes is None:
+            text = repr(data)
+            return text, len(text)
+        omitted = [0]
+        text = _literal(data, omitted)
+        plain_size = len(text) + omitted[0]
+        if plain_size < self._compact_min_bytes:
+            text = repr(data)
+        return text, plain_size
+
+    def add(self, cache_key, data, ttl, checksum=0):
+        """Queue an entry for the next flush().
+
+        Returns (plain_size, stored_size) of the data column in characters.
+        """
+        expires = int(time.time()) + ttl
+        text, plain_size = self.encode(data)
+        self._pending.append((cache_key, expires, text, checksum))
+        self._pending_size += len(text)
+        return plain_size, len(text)
+
+    @property
+    def pending_size(self):
+        """Characters of data queued for the next flush()."""
+        return self._pending_size
+
+    def extend(self, cache_key, ttl):
+        """Queue an expiry-only update for an entry whose content is unchanged."""
+        self._extend.append((int(time.time()) + ttl, cache_key))
+
+    def flush(self):
+        """Write all queued entries in one transaction.
+
+        Returns the number of rows written or extended (0 if the DB stayed locked).
+        """
+        if not (self._pending or self._extend) or self._conn is None:
+            return 0
+        rows, self._pending = self._pending, []
+        extend, self._extend = self._extend, []
+        self._pending_size = 0
+
+        def write(conn):
+            conn.executemany(
+                'INSERT OR REPLACE INTO simplecache(id, expires, data, checksum) '
+                'VALUES (?, ?, ?, ?)', rows)
+            conn.executemany('UPDATE simplecache SET expires = ? WHERE id = ?', extend)
+            return len(rows) + len(extend)
+
+        return self._transaction(write) or 0
+
+    def _transaction(self, work):
+        """Run work(conn) inside BEGIN IMMEDIATE, retrying while the DB is locked.
+
+        Returns work's result, or None if the DB stayed locked or failed.
+        """
+        if self._conn is None:
+            return None
+        for attempt in range(1, FLUSH_ATTEMPTS + 1):
+            try:
+                self._conn.execute('BEGIN IMMEDIATE')
+                try:
+                    result = work(self._conn)
+                    self._conn.execute('COMMIT')
+                except Exception:
+                    self._conn.execute('ROLLBACK')
+                    raise
+                return result
+            except sqlite3.OperationalError as e:
+                log(f'DB busy ({e}), attempt {attempt}/{FLUSH_ATTEMPTS}', xbmc.LOGWARNING)
+                time.sleep(attempt)
+            except Exception as e:
+                log(f'DB error: {e}', xbmc.LOGWARNING)
+                return None
+        return None
+
+    def _pragma(self, name):
+        return self._conn.execute(f'PRAGMA {name}').fetchone()[0]
+
+    def prune(self, current_prefix, url_marker, max_bytes):
+        """Delete rows that can no longer be served and cap the DB size.
+
+        Removes expired rows, rows whose key contains url_marker but not
+        behind current_prefix (left behind by older Stream Cinema versions)
+        and then, while the live data exceeds max_bytes, the rows closest to
+        expiry. Returns (expired, stale, evicted) counts, or None on failure.
+        """
+        def work(conn):
+            expired = conn.execute(
+                'DELETE FROM simplecache WHERE expires < ?', (int(time.time()),)).rowcount
+            stale = conn.execute(
+                'DELETE FROM simplecache WHERE instr(id, ?) > 1 AND substr(id, 1, ?) != ?',
+                (url_marker, len(current_prefix), current_prefix)).rowcount
+            used = (self._pragma('page_count') - self._pragma('freelist_count')) \
+                * self._pragma('page_size')
+            excess = used - max_bytes
+            victims = []
+            if excess > 0:
+                rows = conn.execute(
+                    'SELECT id, length(id) + length(CAST(data AS BLOB)) '
+                    'FROM simplecache ORDER BY expires')
+                for cache_key, size in rows:
+                    if excess <= 0:
+                        break
+                    victims.append((cache_key,))
+                    excess -= size or 0
+                conn.executemany('DELETE FROM simplecache WHERE id = ?', victims)
+            return expired, stale, len(victims)
+
+        return self._transaction(work)
+
+    def vacuum(self, min_bytes=VACUUM_MIN_BYTES, min_ratio=VACUUM_MIN_RATIO):
+        """Return free pages to the filesystem if enough of the file is unused.
+
+        With incremental auto_vacuum this only truncates the free pages. Otherwise
+        a full VACUUM rebuilds the file once and switches it to incremental mode,
+        so later passes stay cheap. Returns the number of bytes freed.
+        """
+        if self._conn is None:
+            return 0
+        try:
+            page_size = self._pragma('page_size')
+            free_pages = self._pragma('freelist_count')
+            free_bytes = free_pages * page_size
+            if free_bytes < min_bytes or free_pages < self._pragma('page_count') * min_ratio:
+                return 0
+            if self._pragma('auto_vacuum') == AUTO_VACUUM_INCREMENTAL:
+                self._conn.execute('PRAGMA incremental_vacuum').fetchall()
+            else:
+                self._conn.execute(f'PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}')
+                self._conn.execute('VACUUM')
+            return free_bytes
+        except sqlite3.Error as e:
+            log(f'Vacuum skipped: {e}', xbmc.LOGWARNING)
+            return 0
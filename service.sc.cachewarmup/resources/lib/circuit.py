@@ -0,0 +1,77 @@
+"""SC Cache Warmup – per-host circuit breaker for warmup fetches.
+
+The service is long-lived, so breakers are kept at module level and survive
+between cycles. After FAILURE_THRESHOLD consecutive transient failures a
+host's breaker opens and every fetch to it fails immediately. Once the
+cooldown has passed, a single probe request is let through: success closes
+the breaker, failure reopens it with twice the cooldown (up to MAX_COOLDOWN).
+"""
+
+import threading
+import time
+
+import xbmc
+
+from resources.lib.utils import log
+
+FAILURE_THRESHOLD = 4
+BASE_COOLDOWN = 60
+MAX_COOLDOWN = 30 * 60
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of fetching while a host's breaker is open."""
+
+
+class CircuitBreaker:
+
+    def __init__(self, host):
+        self.host = host
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._cooldown = BASE_COOLDOWN
+        self._open_until = None
+        self._probing = False
+
+    def allow(self):
+        """Return True if a request may be sent now."""
+        with self._lock:
+            if self._open_until is None:
+                return True
+            if self._probing or time.monotonic() < self._open_until:
+                return False
+            self._probing = True
+            return True
+
+    def success(self):
+        with self._lock:
+            if self._open_until is not None:
+                log(f'{self.host} is back, closing circuit')
+            self._failures = 0
+            self._cooldown = BASE_COOLDOWN
+            self._open_until = None
+            self._probing = False
+
+    def failure(self):
+        """Record a transient failure; opens the breaker at the threshold."""
+        with self._lock:
+            self._failures += 1
+            if self._probing:
+                self._probing = False
+                self._cooldown = min(self._cooldown * 2, MAX_COOLDOWN)
+            elif self._open_until is not None or self._failures < FAILURE_THRESHOLD:
+                return
+            self._open_until = time.monotonic() + self._cooldown
+            log(f'{self.host} is failing, skipping it for {self._cooldown}s',
+                xbmc.LOGWARNING)
+
+
+def get_breaker(host):
+    """Return the shared breaker for host."""
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
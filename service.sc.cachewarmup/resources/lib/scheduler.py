@@ -0,0 +1,193 @@
+"""SC Cache Warmup – usage-driven scheduling of warmup work.
+
+SimpleCache only writes to simplecache.db when the Stream Cinema addon had
+to fetch something itself, i.e. the user opened a listing that was missing
+or expired in the cache. Polling the DB for rows that changed without us
+writing them therefore tells us which endpoints the household opens, and at
+what hour. A changed row still carrying the checksum a warmup run recorded
+for it (load_written_checksums()) was written by us, including manual runs.
+That history drives three things:
+
+* endpoints that get used are refreshed at the configured interval, rarely
+  used ones RARE_FACTOR times less often;
+* an endpoint that is usually opened at this hour is refreshed PREWARM_LEAD
+  ahead of time if its cache entry would have expired by then;
+* endpoints outside ENDPOINTS that keep getting opened are warmed too.
+
+Endpoints outside ENDPOINTS are forgotten once their usage has decayed
+below FORGET_SCORE, and at most MAX_TRACKED of them are kept.
+"""
+
+import json
+import os
+import sqlite3
+import time
+
+import xbmc
+
+from resources.lib.stats import record_refetches
+from resources.lib.utils import get_profile_dir, log, write_json_atomic
+from resources.lib.warmup import (
+    BASE_URL, CACHE_DB, ENDPOINTS, build_params, get_addon_version,
+    get_interval_seconds, get_sc_settings, load_written_checksums, make_job,
+)
+
+USAGE_FILE = 'usage.json'
+# How often the service polls the DB and re-plans
+TICK_SECONDS = 300
+# Until we have this much history, every endpoint is treated as used
+LEARNING_SECONDS = 3 * 86400
+# Usage events lose half their weight after this long
+HALF_LIFE_SECONDS = 14 * 86400
+# Decayed event count from which an endpoint counts as used (one recent visit)
+HOT_SCORE = 0.75
+RARE_FACTOR = 4
+MAX_INTERVAL = 86400
+# Refresh ahead of expected use this far in advance
+PREWARM_LEAD = 20 * 60
+MAX_LEARNED = 20
+# Learned endpoints below this decayed score (11 weeks after a
+# single visit) are dropped, and only the MAX_TRACKED best ones are kept
+FORGET_SCORE = 0.02
+MAX_TRACKED = 500
+
+
+class Scheduler:
+    """Learns endpoint usage from simplecache.db and plans warmup runs."""
+
+    def __init__(self):
+        self._path = os.path.join(get_profile_dir(), USAGE_FILE)
+        self._usage = self._load()
+        self._snapshot = None
+
+    def _load(self):
+        try:
+            with open(self._path, encoding='utf-8') as f:
+                usage = json.load(f)
+        except Exception:
+            usage = {}
+        usage.setdefault('since', time.time())
+        usage.setdefault('endpoints', {})
+        return usage
+
+    def _save(self):
+        try:
+            write_json_atomic(self._path, self._usage)
+        except Exception as e:
+            log(f'Cannot save usage stats: {e}', xbmc.LOGWARNING)
+
+    def _entry(self, endpoint_id):
+        return self._usage['endpoints'].setdefault(
+            endpoint_id, {'hours': [0.0] * 24, 'updated': time.time(), 'warmed': 0})
+
+    def _score(self, entry, now):
+        """Decay an entry's hourly counts to now and return their sum."""
+        factor = 0.5 ** ((now - entry['updated']) / HALF_LIFE_SECONDS)
+        entry['hours'] = [h * factor for h in entry['hours']]
+        entry['updated'] = now
+        return sum(entry['hours'])
+
+    def _read_rows(self, prefix):
+        try:
+            conn = sqlite3.connect(f'file:{CACHE_DB}?mode=ro', uri=True, timeout=2)
+            try:
+                return {cache_key: (expires, checksum) for cache_key, expires, checksum
+                        in conn.execute(
+                            'SELECT id, expires, checksum FROM simplecache '
+                            'WHERE substr(id, 1, ?) = ?', (len(prefix), prefix))}
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            log(f'Cannot read cache DB for usage: {e}', xbmc.LOGWARNING)
+            return None
+
+    def observe(self, record=True):
+        """Compare the DB with the last snapshot and record SC-made writes.
+
+        Call with record=False right after our own warmup so its writes
+        become the new baseline instead of counting as usage. SC replacing
+        a row we wrote is also counted as a miss of the last cycle.
+        """
+        try:
+            addon_ver = get_addon_version()
+        except Exception:
+            return
+        rows = self._read_rows(addon_ver + BASE_URL)
+        if rows is None:
+            return
+        previous, self._snapshot = self._snapshot, rows
+        if not record or previous is None:
+            return
+
+        now = time.time()
+        hour = time.localtime(now).tm_hour
+        written = load_written_checksums()
+        seen = refetched = 0
+        for cache_key, row in rows.items():
+            old = previous.get(cache_key)
+            if old == row or written.get(cache_key) == row[1]:
+                continue
+            entry = self._entry(cache_key[len(addon_ver):])
+            self._score(entry, now)
+            entry['hours'][hour] += 1
+            seen += 1
+            if old and cache_key in written and written[cache_key] == old[1]:
+                refetched += 1
+        if seen:
+            log(f'Observed {seen} cache refreshes by Stream Cinema '
+                f'({refetched} of rows we wrote)')
+            self._save()
+            record_refetches(refetched)
+
+    def plan(self):
+        """Return {endpoint_id: ttl} of the endpoints due for warmup now."""
+        try:
+            addon_ver = get_addon_version()
+        except Exception:
+            return {}
+        now = time.time()
+        base = get_interval_seconds()
+        learning = now - self._usage['since'] < LEARNING_SECONDS
+        upcoming_hour = time.localtime(now + PREWARM_LEAD).tm_hour
+
+        params = build_params(get_sc_settings())
+        candidates = {make_job(ep, params, addon_ver).cache_key[len(addon_ver):]
+                      for ep in ENDPOINTS}
+        scores = {eid: self._score(self._entry(eid), now) for eid in candidates}
+        learned = sorted(
+            ((self._score(entry, now), eid)
+             for eid, entry in self._usage['endpoints'].items() if eid not in candidates),
+            reverse=True)
+        self._forget([eid for score, eid in learned[MAX_TRACKED:]]
+                     + [eid for score, eid in learned[:MAX_TRACKED] if score < FORGET_SCORE])
+        for score, eid in learned[:MAX_LEARNED]:
+            if score >= HOT_SCORE:
+                scores[eid] = score
+
+        plan = {}
+        for eid, score in scores.items():
+            entry = self._entry(eid)
+            hot = learning or score >= HOT_SCORE
+            interval = base if hot else min(base * RARE_FACTOR, MAX_INTERVAL)
+            expires = entry['warmed'] + interval
+            if expires <= now:
+                plan[eid] = interval
+            elif (entry['hours'][upcoming_hour] >= HOT_SCORE / 2
+                  and expires < now + PREWARM_LEAD):
+                # Usually opened around this time; make sure it is fresh then
+                plan[eid] = interval
+        return plan
+
+    def _forget(self, endpoint_ids):
+        if not endpoint_ids:
+            return
+        for eid in endpoint_ids:
+            del self._usage['endpoints'][eid]
+        log(f'Forgot {len(endpoint_ids)} rarely used endpoints')
+        self._save()
+
+    def mark_warmed(self, endpoint_ids):
+        now = time.time()
+        for eid in endpoint_ids:
+            self._entry(eid)['warmed'] = now
+        self._save()
@@ -0,0 +1,161 @@
+"""SC Cache Warmup – per-cycle metrics kept in a rolling stats file.
+
+Every warmup cycle appends one record to stats.json in this addon's profile
+(the last MAX_CYCLES are kept): per-endpoint latency, payload bytes and
+outcome, DB write time, failure reasons and the share of endpoints that came
+back unchanged. In adaptive mode the scheduler adds how many of the rows a
+cycle wrote Stream Cinema still had to fetch itself before the next one
+(record_refetches()), i.e. the warmup's misses. summarize() turns them into
+the text shown by RunScript(service.sc.cachewarmup,stats).
+"""
+
+import json
+import os
+import time
+from collections import Counter
+
+import xbmc
+
+from resources.lib.utils import get_profile_dir, log, write_json_atomic
+
+STATS_FILE = 'stats.json'
+MAX_CYCLES = 30
+SLOWEST_ENDPOINTS = 15
+
+
+class CycleStats:
+    """Collects the metrics of one warmup cycle.
+
+    observed=True starts a refetch count for record_refetches() to add to,
+    for cycles whose writes the scheduler watches.
+    """
+
+    def __init__(self, observed=False):
+        self._start = time.monotonic()
+        self.record = {
+            'time': int(time.time()),
+            'endpoints': {},
+            'failures': {},
+        }
+        if observed:
+            self.record['refetched'] = 0
+
+    def endpoint(self, ep, outcome, latency, size=0, reason=None):
+        """Record one fetch; outcome is 'ok', 'unchanged' or 'failed'."""
+        entry = {'outcome': outcome, 'latency': round(latency, 3), 'bytes': size}
+        if reason:
+            entry['reason'] = reason
+            failures = self.record['failures']
+            failures[reason] = failures.get(reason, 0) + 1
+        self.record['endpoints'][ep] = entry
+
+    def db_write(self, seconds, rows, stored_bytes=0, plain_bytes=0):
+        self.record.update(db_write=round(seconds, 3), rows=rows,
+                           stored_bytes=stored_bytes, plain_bytes=plain_bytes)
+
+    def finish(self, total):
+        """Complete the record with totals and append it to the stats file."""
+        endpoints = self.record['endpoints'].values()
+        fetched = sum(1 for e in endpoints if e['outcome'] != 'failed')
+        unchanged = sum(1 for e in endpoints if e['outcome'] == 'unchanged')
+        self.record.update(
+            duration=round(time.monotonic() - self._start, 3),
+            total=total,
+            fetched=fetched,
+            unchanged=unchanged,
+            failed=len(endpoints) - fetched,
+            bytes=sum(e['bytes'] for e in endpoints),
+            unchanged_ratio=round(unchanged / fetched, 3) if fetched else 0.0,
+        )
+        save_cycle(self.record)
+        return self.record
+
+
+def _path():
+    return os.path.join(get_profile_dir(), STATS_FILE)
+
+
+def load_cycles():
+    """Return the stored cycle records, oldest first."""
+    try:
+        with open(_path(), encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return []
+
+
+def _save(cycles):
+    try:
+        write_json_atomic(_path(), cycles)
+    except Exception as e:
+        log(f'Cannot save stats: {e}', xbmc.LOGWARNING)
+
+
+def save_cycle(record):
+    cycles = load_cycles()[-(MAX_CYCLES - 1):]
+    cycles.append(record)
+    _save(cycles)
+
+
+def record_refetches(count):
+    """Add count rows of the last cycle that Stream Cinema fetched again itself."""
+    cycles = load_cycles()
+    if not cycles or not count:
+        return
+    cycles[-1]['refetched'] = cycles[-1].get('refetched', 0) + count
+    _save(cycles)
+
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else 0
+
+
+def summarize(cycles):
+    """Return a plain-text report of the given cycle records."""
+    if not cycles:
+        return 'No warmup cycles recorded yet.'
+    first = time.strftime('%Y-%m-%d %H:%M', time.localtime(cycles[0]['time']))
+    last = cycles[-1]
+    fetched = sum(c.get('fetched', 0) for c in cycles)
+    unchanged = sum(c.get('unchanged', 0) for c in cycles)
+    observed = [c for c in cycles if 'refetched' in c]
+    refetched = sum(c['refetched'] for c in observed)
+    warmed = sum(c.get('rows', 0) for c in observed)
+    plain = sum(c.get('plain_bytes', 0) for c in cycles)
+    stored = sum(c.get('stored_bytes', 0) for c in cycles)
+    failures = Counter()
+    for c in cycles:
+        failures.update(c.get('failures', {}))
+
+    lines = [
+        f'{len(cycles)} cycles since {first}',
+        f'Last cycle: {last.get("fetched", 0)}/{last.get("total", 0)} fetched, '
+        f'{last.get("rows", 0)} rows written in {last.get("db_write", 0):.3f}s, '
+        f'{last.get("duration", 0):.1f}s total',
+        f'Downloaded: {sum(c.get("bytes", 0) for c in cycles) // 1024} KB, '
+        f'{_median([c.get("bytes", 0) for c in cycles]) // 1024} KB per cycle (median)',
+        f'Unchanged: {unchanged}/{fetched} fetches'
+        + (f' ({100 * unchanged / fetched:.0f}%)' if fetched else ''),
+        f'DB write: {_median([c.get("db_write", 0) for c in cycles]):.3f}s per cycle (median)',
+    ]
+    if warmed:
+        lines.append(f'Refetched by Stream Cinema: {refetched}/{warmed} warmed rows '
+                     f'({100 * refetched / warmed:.0f}% misses)')
+    if stored < plain:
+        lines.append(f'Compact storage: {plain // 1024} KB stored as {stored // 1024} KB')
+    lines.append('Failures: ' + (', '.join(f'{reason} x{n}' for reason, n in
+                                           failures.most_common()) or 'none'))
+
+    per_endpoint = {}
+    for c in cycles:
+        for ep, e in c.get('endpoints', {}).items():
+            per_endpoint.setdefault(ep, []).append(e)
+    lines += ['', 'Slowest endpoints (median latency, median size, failures):']
+    rows = sorted(((_median([e['latency'] for e in entries]), ep, entries)
+                   for ep, entries in per_endpoint.items()), reverse=True)
+    for latency, ep, entries in rows[:SLOWEST_ENDPOINTS]:
+        failed = sum(1 for e in entries if e['outcome'] == 'failed')
+        size = _median([e['bytes'] for e in entries if e['bytes']]) // 1024
+        lines.append(f'  {latency:6.2f}s {size:6d} KB {failed:3d}  {ep}')
+    return '\n'.join(lines)
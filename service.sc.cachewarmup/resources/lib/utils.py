@@ -0,0 +1,45 @@
+"""SC Cache Warmup – logging and profile helpers shared by the warmup modules."""
+
+import json
+import os
+import tempfile
+
+import xbmc
+import xbmcaddon
+import xbmcvfs
+
+TAG = '[SC Cache Warmup]'
+
+
+def log(msg, level=xbmc.LOGINFO):
+    xbmc.log(f'{TAG} {msg}', level)
+
+
+def get_profile_dir():
+    """Return this addon's userdata directory, creating it if needed."""
+    profile = xbmcvfs.translatePath(xbmcaddon.Addon().getAddonInfo('profile'))
+    if not os.path.isdir(profile):
+        os.makedirs(profile, exist_ok=True)
+    return profile
+
+
+def write_json_atomic(path, data):
+    """Write JSON so readers see either the old or the new file.
+
+    The data goes to a uniquely named temp file in the same directory (the
+    service and a manual run may write at once), is fsynced and then renamed
+    over path, so neither a crash nor a power loss leaves it truncated.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
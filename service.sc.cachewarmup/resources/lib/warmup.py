@@ -1,16 +1,28 @@
 """SC Cache Warmup – shared warmup logic."""
 
+import ast
+import hashlib
 import json
 import os
-import sqlite3
+import random
+import socket
+import threading
 import time
 import xml.etree.ElementTree as ET
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.error import HTTPError, URLError
 from urllib.request import Request, urlopen
 from urllib.parse import urlencode, urlparse, parse_qs
 
 import xbmc
 import xbmcaddon
 
+from resources.lib.cache_writer import CacheWriter
+from resources.lib.circuit import CircuitOpenError, get_breaker
+from resources.lib.stats import CycleStats
+from resources.lib.utils import get_profile_dir, log, write_json_atomic
+
 # --- Config (hardcoded for LibreELEC) ---
 SC_ADDON_DIR = '/storage/.kodi/addons/plugin.video.stream-cinema'
 SC_SETTINGS_FILE = '/storage/.kodi/userdata/addon_data/plugin.video.stream-cinema/settings.xml'
@@ -41,11 +53,36 @@ INTERVAL_MAP = {
     '2 hours': 7200,
     '4 hours': 14400,
 }
-TAG = '[SC Cache Warmup]'
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_DB_MB = 50
+# Transient failures are retried up to RETRY_ATTEMPTS times in total, with
+# full-jitter exponential backoff capped at RETRY_MAX_DELAY seconds
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 8.0
+TRANSIENT_HTTP_CODES = (408, 429, 500, 502, 503, 504)
+COMPACT_MAP = {
+    '16 KB': 16 * 1024,
+    '64 KB': 64 * 1024,
+    '256 KB': 256 * 1024,
+}
+
+# ETag/Last-Modified per cache key, kept in this addon's profile directory
+VALIDATORS_FILE = 'validators.json'
+# Checksum of the row each warmup (service or manual run) last wrote per cache
+# key, so the scheduler can tell our writes from Stream Cinema's
+WRITTEN_FILE = 'written.json'
 
+# data is None when the server answered 304 Not Modified; size is the body length
+FetchResult = namedtuple('FetchResult', 'data checksum etag last_modified size')
+# ep is the endpoint as listed in ENDPOINTS or found in a menu; depth 0 = ENDPOINTS
+Job = namedtuple('Job', 'ep path params cache_key depth')
+CrawlConfig = namedtuple('CrawlConfig', 'depth max_urls rate')
 
-def log(msg, level=xbmc.LOGINFO):
-    xbmc.log(f'{TAG} {msg}', level)
+# Menu entry types that lead to another listing (others play or run actions)
+CRAWL_FOLLOW_TYPES = ('dir', 'next')
+# While crawling, queued rows are written once their data reaches this size
+CRAWL_FLUSH_CHARS = 4 * 1024 * 1024
 
 
 def get_interval_seconds():
@@ -58,6 +95,113 @@ def get_interval_seconds():
         return 7200  # default 2 hours
 
 
+def get_schedule_mode():
+    """Return 'adaptive' or 'fixed' from addon settings."""
+    try:
+        return xbmcaddon.Addon().getSetting('warmup.schedule') or 'adaptive'
+    except Exception:
+        return 'adaptive'
+
+
+def get_worker_count():
+    """Read the number of concurrent fetch workers from addon settings."""
+    try:
+        addon = xbmcaddon.Addon()
+        return max(1, int(addon.getSetting('warmup.workers')))
+    except Exception:
+        return DEFAULT_WORKERS
+
+
+def get_crawl_config():
+    """Read crawl mode settings; returns None when crawling is disabled."""
+    try:
+        addon = xbmcaddon.Addon()
+        if addon.getSetting('crawl.enabled') != 'true':
+            return None
+        return CrawlConfig(
+            depth=int(addon.getSetting('crawl.depth') or 1),
+            max_urls=int(addon.getSetting('crawl.max_urls') or 100),
+            rate=float(addon.getSetting('crawl.rate') or 2),
+        )
+    except Exception:
+        return None
+
+
+def get_max_db_bytes():
+    """Read the cache DB size limit from addon settings."""
+    try:
+        value = xbmcaddon.Addon().getSetting('maintenance.max_size')
+        return int(value.split()[0]) * 1024 * 1024
+    except Exception:
+        return DEFAULT_MAX_DB_MB * 1024 * 1024
+
+
+def get_compact_threshold():
+    """Return the payload size from which rows are stored compact, or None."""
+    try:
+        value = xbmcaddon.Addon().getSetting('storage.compact')
+    except Exception:
+        return None
+    return COMPACT_MAP.get(value)
+
+
+class RateLimiter:
+    """Spaces request starts at least 1/rate seconds apart across threads."""
+
+    def __init__(self, rate):
+        self._interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self._interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def _load_validators():
+    try:
+        with open(os.path.join(get_profile_dir(), VALIDATORS_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def _save_validators(validators):
+    try:
+        write_json_atomic(os.path.join(get_profile_dir(), VALIDATORS_FILE), validators)
+    except Exception as e:
+        log(f'Cannot save validators: {e}', xbmc.LOGWARNING)
+
+
+def load_written_checksums():
+    """Return {cache_key: checksum} of the rows warmup runs last wrote."""
+    try:
+        with open(os.path.join(get_profile_dir(), WRITTEN_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def _save_written_checksums(written, addon_ver):
+    """Merge this cycle's writes in, dropping keys of older Stream Cinema versions."""
+    merged = {key: checksum for key, checksum in load_written_checksums().items()
+              if key.startswith(addon_ver)}
+    merged.update(written)
+    try:
+        write_json_atomic(os.path.join(get_profile_dir(), WRITTEN_FILE), merged)
+    except Exception as e:
+        log(f'Cannot save written checksums: {e}', xbmc.LOGWARNING)
+
+
+def content_checksum(body):
+    """Signed 64-bit content hash, stored in SimpleCache's INTEGER checksum column."""
+    return int.from_bytes(hashlib.blake2b(body, digest_size=8).digest(), 'big', signed=True)
+
+
 def get_addon_version():
     tree = ET.parse(os.path.join(SC_ADDON_DIR, 'addon.xml'))
     return tree.getroot().attrib['version']
@@ -138,38 +282,167 @@ def build_params(settings):
     return sorted(params.items(), key=lambda x: x[0])
 
 
-def fetch_endpoint(path, params, headers):
+def _fetch(path, params, headers, validators=None):
+    """Fetch an endpoint once, conditionally if validators {etag, last_modified} are given.
+
+    Returns a FetchResult (data is None on 304 Not Modified); raises on failure.
+    """
     url = BASE_URL + path + '?' + urlencode(params)
+    headers = dict(headers)
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
     try:
         req = Request(url, headers=headers)
         with urlopen(req, timeout=15) as resp:
-            return json.loads(resp.read().decode())
+            body = resp.read()
+            return FetchResult(json.loads(body.decode()), content_checksum(body),
+                               resp.headers.get('ETag'), resp.headers.get('Last-Modified'),
+                               len(body))
+    except HTTPError as e:
+        if e.code == 304 and validators:
+            return FetchResult(None, None, validators.get('etag'),
+                               validators.get('last_modified'), 0)
+        raise
+
+
+def _is_transient(error):
+    """True for errors worth retrying: timeouts, connection errors, 5xx and 429."""
+    if isinstance(error, HTTPError):
+        return error.code in TRANSIENT_HTTP_CODES
+    return isinstance(error, (URLError, OSError))
+
+
+def _retry_delay(attempt, error):
+    """Seconds to wait before retry number attempt (1-based)."""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    if isinstance(error, HTTPError):
+        try:
+            return min(RETRY_MAX_DELAY, max(delay, float(error.headers.get('Retry-After'))))
+        except (TypeError, ValueError):
+            pass
+    return delay
+
+
+def _fetch_with_retry(path, params, headers, validators=None):
+    """_fetch() guarded by the host's circuit breaker, retrying transient errors."""
+    breaker = get_breaker(urlparse(BASE_URL).netloc)
+    for attempt in range(1, RETRY_ATTEMPTS + 1):
+        if not breaker.allow():
+            raise CircuitOpenError(f'{breaker.host} unavailable')
+        try:
+            result = _fetch(path, params, headers, validators)
+        except Exception as e:
+            if not _is_transient(e):
+                # The host answered; only the request was bad
+                breaker.success()
+                raise
+            breaker.failure()
+            if attempt == RETRY_ATTEMPTS:
+                raise
+            delay = _retry_delay(attempt, e)
+            log(f'Fetch error for {path}: {e}, retry {attempt} in {delay:.1f}s')
+            time.sleep(delay)
+        else:
+            breaker.success()
+            return result
+
+
+def failure_reason(error):
+    """Short, groupable description of a fetch error for the cycle stats."""
+    if isinstance(error, HTTPError):
+        return f'HTTP {error.code}'
+    if isinstance(error, CircuitOpenError):
+        return 'circuit open'
+    if isinstance(error, URLError):
+        error = error.reason
+    if isinstance(error, (socket.timeout, TimeoutError)):
+        return 'timeout'
+    if isinstance(error, ValueError):
+        return 'invalid response'
+    return type(error).__name__
+
+
+def _timed_fetch(path, params, headers, validators, limiter=None):
+    """Returns (result, elapsed, reason); result is None and reason set on error."""
+    if limiter:
+        limiter.wait()
+    start = time.monotonic()
+    try:
+        result, reason = _fetch_with_retry(path, params, headers, validators), None
+    except CircuitOpenError:
+        result, reason = None, 'circuit open'
     except Exception as e:
         log(f'Fetch error for {path}: {e}', xbmc.LOGWARNING)
+        result, reason = None, failure_reason(e)
+    return result, time.monotonic() - start, reason
+
+
+def make_job(ep, params, addon_ver, depth=0):
+    """Build the fetch job and SC cache key for an endpoint URL."""
+    # Parse query params from endpoint URL (e.g. /Recommended?type=0)
+    # and merge them into params, matching SC's Sc.prepare() behavior
+    ep_parsed = urlparse(ep)
+    ep_path = ep_parsed.path
+    ep_query = parse_qs(ep_parsed.query)
+    # Merge: start with default params dict, add endpoint-specific ones
+    merged = dict(params)
+    for k, v in ep_query.items():
+        merged[k] = v[0] if len(v) == 1 else v
+    ep_params = sorted(merged.items(), key=lambda x: x[0])
+
+    url = BASE_URL + ep_path
+    cache_key = f'{addon_ver}{url}{ep_params}'
+    return Job(ep, ep_path, ep_params, cache_key, depth)
+
+
+def job_from_endpoint_id(endpoint_id, addon_ver):
+    """Rebuild a Job from an endpoint id (cache key without the version prefix).
+
+    Used for endpoints learned from the cache DB rather than ENDPOINTS; the
+    params are taken verbatim from the key so the rebuilt key is identical.
+    Returns None if the id does not look like one of ours.
+    """
+    if not endpoint_id.startswith(BASE_URL) or '[' not in endpoint_id:
         return None
-
-
-def store_in_cache(cache_key, data, ttl):
-    expires = int(time.time()) + ttl
+    split = endpoint_id.index('[')
+    path = endpoint_id[len(BASE_URL):split]
     try:
-        conn = sqlite3.connect(CACHE_DB, timeout=30)
-        conn.execute(
-            'CREATE TABLE IF NOT EXISTS simplecache('
-            'id TEXT UNIQUE, expires INTEGER, data TEXT, checksum INTEGER)')
-        conn.execute(
-            'INSERT OR REPLACE INTO simplecache(id, expires, data, checksum) VALUES (?, ?, ?, ?)',
-            (cache_key, expires, repr(data), 0))
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        log(f'DB error: {e}', xbmc.LOGWARNING)
-        return False
-
-
-def run_warmup():
+        params = ast.literal_eval(endpoint_id[split:])
+    except (ValueError, SyntaxError):
+        return None
+    return Job(path, path, params, addon_ver + endpoint_id, 0)
+
+
+def menu_links(data):
+    """Return the endpoint URLs of listing entries in a response's menu."""
+    if not isinstance(data, dict):
+        return []
+    links = []
+    for item in data.get('menu') or []:
+        if not isinstance(item, dict):
+            continue
+        url = item.get('url')
+        if not isinstance(url, str) or item.get('type', 'dir') not in CRAWL_FOLLOW_TYPES:
+            continue
+        if url.startswith(BASE_URL):
+            url = url[len(BASE_URL):]
+        if url.startswith('/'):
+            links.append(url)
+    return links
+
+
+def run_warmup(plan=None, warmed=None):
     """Execute one warmup cycle across all endpoints.
 
+    plan optionally limits the cycle to {endpoint_id: ttl} (see Scheduler),
+    where endpoint_id is a cache key without the addon version prefix. If
+    warmed is a set, the endpoint ids that were stored are added to it.
+    With crawl mode enabled, listing entries in fetched menus are followed
+    up to the configured depth, URL count and request rate, and results are
+    written in batches of CRAWL_FLUSH_CHARS instead of all at the end.
     Returns the number of successfully cached endpoints.
     """
     log('Starting warmup cycle')
@@ -188,33 +461,158 @@ def run_warmup():
     }
 
     interval = get_interval_seconds()
+    crawl = get_crawl_config()
+    limiter = RateLimiter(crawl.rate) if crawl else None
+    jobs = [make_job(ep, params, addon_ver) for ep in ENDPOINTS]
+    ttls = {}
+    if plan is not None:
+        by_id = {job.cache_key[len(addon_ver):]: job for job in jobs}
+        jobs = []
+        for endpoint_id, ttl in plan.items():
+            job = by_id.get(endpoint_id) or job_from_endpoint_id(endpoint_id, addon_ver)
+            if job:
+                jobs.append(job)
+                ttls[job.cache_key] = ttl
+    visited = {job.cache_key for job in jobs}
+    stats = CycleStats(observed=plan is not None)
+
+    # Fetch concurrently; results are queued by this thread only, as they
+    # arrive, and written to the DB in one transaction at the end (in batches
+    # while crawling)
+    validators = _load_validators()
+    # Checksums queued since the last flush, and those of committed rows
+    written = {}
+    committed = {}
+    fetched = 0
     cached = 0
-    for ep in ENDPOINTS:
-        # Parse query params from endpoint URL (e.g. /Recommended?type=0)
-        # and merge them into params, matching SC's Sc.prepare() behavior
-        ep_parsed = urlparse(ep)
-        ep_path = ep_parsed.path
-        ep_query = parse_qs(ep_parsed.query)
-        # Merge: start with default params dict, add endpoint-specific ones
-        merged = dict(params)
-        for k, v in ep_query.items():
-            merged[k] = v[0] if len(v) == 1 else v
-        ep_params = sorted(merged.items(), key=lambda x: x[0])
-
-        url = BASE_URL + ep_path
-        cache_key = f'{addon_ver}{url}{ep_params}'
-        data = fetch_endpoint(ep_path, ep_params, headers)
-        if data and store_in_cache(cache_key, data, interval):
-            if isinstance(data, dict):
-                items = len(data.get('menu', []))
-                log(f'{ep} -> OK ({items} items)')
-            else:
-                log(f'{ep} -> OK ({len(data)} entries)')
-            cached += 1
-        elif data is None:
-            pass  # error already logged
-        else:
-            log(f'{ep} -> DB write failed', xbmc.LOGWARNING)
-
-    log(f'Warmup done: {cached}/{len(ENDPOINTS)} endpoints cached')
+    write_time = 0.0
+    unchanged = 0
+    plain_total = stored_total = 0
+    with CacheWriter(CACHE_DB, compact_min_bytes=get_compact_threshold()) as writer, \
+            ThreadPoolExecutor(max_workers=get_worker_count()) as pool:
+        checksums = {}
+
+        def flush():
+            count = writer.flush()
+            if count == len(written):
+                committed.update(written)
+            written.clear()
+            return count
+
+        def submit(new_jobs):
+            checksums.update(writer.load_checksums([job.cache_key for job in new_jobs]))
+            for job in new_jobs:
+                # Only revalidate entries still in the DB, a 304 can't restore a row
+                job_validators = (validators.get(job.cache_key)
+                                  if job.cache_key in checksums else None)
+                future = pool.submit(_timed_fetch, job.path, job.params, headers,
+                                     job_validators, limiter)
+                pending[future] = job
+
+        pending = {}
+        submit(jobs)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = pending.pop(future)
+                ep, cache_key = job.ep, job.cache_key
+                result, elapsed, reason = future.result()
+                if result is None:
+                    stats.endpoint(ep, 'failed', elapsed, reason=reason)
+                    log(f'{ep} -> failed after {elapsed:.2f}s', xbmc.LOGWARNING)
+                    continue
+                links = []
+                if crawl:
+                    # A 304 has no body; reuse the links seen with this ETag
+                    links = (menu_links(result.data) if result.data is not None
+                             else validators.get(cache_key, {}).get('links', []))
+                if result.etag or result.last_modified:
+                    validators[cache_key] = {'etag': result.etag,
+                                             'last_modified': result.last_modified,
+                                             'links': links}
+                else:
+                    validators.pop(cache_key, None)
+                fetched += 1
+                ttl = ttls.get(cache_key, interval)
+                if warmed is not None:
+                    warmed.add(cache_key[len(addon_ver):])
+
+                if result.data is None or checksums.get(cache_key) == result.checksum:
+                    writer.extend(cache_key, ttl)
+                    written[cache_key] = checksums.get(cache_key)
+                    unchanged += 1
+                    stats.endpoint(ep, 'unchanged', elapsed, result.size)
+                    log(f'{ep} -> unchanged ({elapsed:.2f}s)')
+                else:
+                    plain, stored = writer.add(cache_key, result.data, ttl, result.checksum)
+                    written[cache_key] = result.checksum
+                    plain_total += plain
+                    stored_total += stored
+                    stats.endpoint(ep, 'ok', elapsed, result.size)
+                    size = (f', {plain // 1024} -> {stored // 1024} KB'
+                            if stored < plain else '')
+                    data = result.data
+                    if isinstance(data, dict):
+                        items = len(data.get('menu', []))
+                        log(f'{ep} -> OK ({items} items, {elapsed:.2f}s{size})')
+                    else:
+                        log(f'{ep} -> OK ({len(data)} entries, {elapsed:.2f}s{size})')
+                    if crawl and writer.pending_size >= CRAWL_FLUSH_CHARS:
+                        start = time.monotonic()
+                        cached += flush()
+                        write_time += time.monotonic() - start
+
+                if crawl and job.depth < crawl.depth:
+                    children = []
+                    for link in links:
+                        if len(visited) >= crawl.max_urls:
+                            break
+                        child = make_job(link, params, addon_ver, job.depth + 1)
+                        if child.cache_key not in visited:
+                            visited.add(child.cache_key)
+                            children.append(child)
+                    if children:
+                        submit(children)
+
+        start = time.monotonic()
+        cached += flush()
+        if cached < fetched:
+            log('DB write failed', xbmc.LOGWARNING)
+            if warmed is not None:
+                warmed.clear()
+        if committed:
+            _save_written_checksums(committed, addon_ver)
+        write_time += time.monotonic() - start
+        stats.db_write(write_time, cached, stored_total, plain_total)
+        log(f'DB write: {cached} rows ({unchanged} unchanged) in {write_time:.3f}s')
+        if stored_total < plain_total:
+            log(f'Compact storage saved {(plain_total - stored_total) // 1024} KB '
+                f'of {plain_total // 1024} KB')
+
+    _save_validators(validators)
+    stats.finish(len(visited))
+    log(f'Warmup done: {cached}/{len(visited)} endpoints cached')
     return cached
+
+
+def run_maintenance():
+    """Prune simplecache.db and vacuum it when enough space is free.
+
+    Deletes expired rows, rows of older Stream Cinema versions and, above the
+    configured size limit, the rows closest to expiry.
+    """
+    try:
+        addon_ver = get_addon_version()
+    except Exception as e:
+        log(f'Cannot read SC addon version: {e}', xbmc.LOGERROR)
+        return
+    start = time.monotonic()
+    with CacheWriter(CACHE_DB) as writer:
+        removed = writer.prune(addon_ver + BASE_URL, BASE_URL, get_max_db_bytes())
+        if removed is None:
+            log('Maintenance skipped, cache DB unavailable', xbmc.LOGWARNING)
+            return
+        freed = writer.vacuum()
+    expired, stale, evicted = removed
+    log(f'Maintenance: {expired} expired, {stale} old-version, {evicted} over-limit rows '
+        f'deleted, {freed // 1024} KiB freed in {time.monotonic() - start:.3f}s')
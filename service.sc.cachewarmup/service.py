@@ -3,17 +3,33 @@ Periodically fetches Stream Cinema API responses and stores them in the
 addon's SimpleCache SQLite DB so content loads faster.
 """
 
+import time
+
 import xbmc
 
-from resources.lib.warmup import run_warmup, get_interval_seconds, log
+from resources.lib.warmup import (
+    run_warmup, run_maintenance, get_interval_seconds, get_schedule_mode, log,
+)
 
+MAINTENANCE_INTERVAL = 86400
+
+_last_maintenance = None
 
-def main():
-    monitor = xbmc.Monitor()
-    log('Service started')
 
+def maybe_run_maintenance():
+    """Prune the cache DB at service start and then once a day."""
+    global _last_maintenance
+    now = time.monotonic()
+    if _last_maintenance is None or now - _last_maintenance >= MAINTENANCE_INTERVAL:
+        _last_maintenance = now
+        run_maintenance()
+
+
+def run_fixed(monitor):
+    """Warm every endpoint, then sleep for the configured interval."""
     while not monitor.abortRequested():
         run_warmup()
+        maybe_run_maintenance()
 
         interval = get_interval_seconds()
         log(f'Next warmup in {interval // 60} minutes')
@@ -21,6 +37,37 @@ def main():
         if monitor.waitForAbort(interval):
             break
 
+
+def run_adaptive(monitor):
+    """Poll usage and warm only the endpoints the scheduler says are due."""
+    from resources.lib.scheduler import Scheduler, TICK_SECONDS
+
+    scheduler = Scheduler()
+    while not monitor.abortRequested():
+        scheduler.observe()
+        plan = scheduler.plan()
+        if plan:
+            log(f'{len(plan)} endpoints due')
+            warmed = set()
+            run_warmup(plan, warmed)
+            scheduler.mark_warmed(warmed)
+            # Our own writes are the new baseline, not usage
+            scheduler.observe(record=False)
+        maybe_run_maintenance()
+
+        if monitor.waitForAbort(TICK_SECONDS):
+            break
+
+
+def main():
+    monitor = xbmc.Monitor()
+    log('Service started')
+
+    if get_schedule_mode() == 'fixed':
+        run_fixed(monitor)
+    else:
+        run_adaptive(monitor)
+
     log('Service stopped')
 
 